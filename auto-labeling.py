@@ -0,0 +1,211 @@
+import os
+import cv2
+import json
+import numpy as np
+from ocr_pool import run_pool
+from preprocessing import image_folder, json_file_path, load_image_labels
+
+# Images are labelled from cheap statistics of a reduced decode; the labels are written to the same
+# image_labels.json as labeling-tool.py, and images whose labels are uncertain are listed for manual review
+review_file_path = os.path.join('image_labels', 'review.json')
+workers = os.cpu_count()
+
+# Labels already in image_labels.json (set by hand or reviewed) are kept unless this is True
+overwrite_labels = False
+# Images with a lower confidence are listed in review_file_path
+review_confidence = 0.5
+
+# Statistics are taken on the image decoded at 1/4 of its size and at most analysis_size pixels wide
+analysis_size = 512
+
+# Decision thresholds and the distance from each threshold at which a decision counts as certain. With
+# calibrate_thresholds they are only the starting point: the thresholds are fitted to the images already labelled
+# in image_labels.json, and the distances are the spread of each statistic over those images, so an image close
+# to a threshold is listed for review
+calibrate_thresholds = True
+dark_background_fraction = 0.45, 0.17
+blur_variance = 150.0, 0.4
+saturation = 32.0, 16.0
+contrast = 174.0, 30.0
+
+
+def image_statistics(image):
+    height, width = image.shape[:2]
+    if max(height, width) > analysis_size:
+        scale = analysis_size / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    cumulative = np.cumsum(histogram) / gray.size
+
+    # Otsu's threshold from the histogram; the background is the larger of the two classes
+    threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    bright_fraction = 1 - cumulative[int(threshold)]
+
+    low, high = np.searchsorted(cumulative, [0.05, 0.95])
+
+    return {
+        'mean': float(gray.mean()),
+        'bright_fraction': float(bright_fraction),
+        'contrast': float(high - low),
+        'blur_variance': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        'saturation': float(cv2.cvtColor(image, cv2.COLOR_BGR2HSV)[:, :, 1].mean()),
+    }
+
+
+def certainty(value, threshold, distance):
+    return min(1.0, abs(value - threshold) / distance)
+
+
+def default_thresholds():
+    return {'bright_fraction': dark_background_fraction, 'blur_variance': blur_variance,
+            'saturation': saturation, 'contrast': contrast}
+
+
+def choose_labels(statistics, thresholds=None):
+    # Returns the labels and the confidence of the least certain decision behind them
+    if thresholds is None:
+        thresholds = default_thresholds()
+    labels = []
+    certainties = []
+
+    threshold, distance = thresholds['bright_fraction']
+    certainties.append(certainty(statistics['bright_fraction'], threshold, distance))
+    if statistics['bright_fraction'] < threshold:
+        labels.append('White on Black')
+
+    # Sharpness varies over orders of magnitude, so it is compared on a log scale
+    threshold, distance = thresholds['blur_variance']
+    certainties.append(certainty(np.log10(statistics['blur_variance'] + 1), np.log10(threshold + 1), distance))
+    if statistics['blur_variance'] < threshold:
+        labels.append('Blur-High-Contrast')
+
+    # Ink on colored paper or photographed notes
+    threshold, distance = thresholds['saturation']
+    certainties.append(certainty(statistics['saturation'], threshold, distance))
+    if statistics['saturation'] > threshold:
+        labels.append('Handwriting')
+
+    if not labels:
+        threshold, distance = thresholds['contrast']
+        certainties.append(certainty(statistics['contrast'], threshold, distance))
+        labels.append('Same Back Stylewriting' if statistics['contrast'] < threshold else 'White Background')
+
+    return labels, float(min(certainties))
+
+
+def agreement(samples, thresholds):
+    # Number of (statistics, labels) samples whose chosen labels are exactly the given ones
+    return sum(set(choose_labels(statistics, thresholds)[0]) == set(labels) for statistics, labels in samples)
+
+
+def calibrate(samples, thresholds, passes=3):
+    # Fits the thresholds to labelled (statistics, labels) samples one decision at a time, trying the midpoints
+    # between the observed values and keeping a threshold only when it agrees with more labels
+    thresholds = dict(thresholds)
+    for name in thresholds:
+        values = np.array([statistics[name] for statistics, labels in samples])
+        if name == 'blur_variance':
+            values = np.log10(values + 1)
+        # The spread of the statistic is the distance at which a decision counts as certain
+        if values.std() > 0:
+            thresholds[name] = thresholds[name][0], float(values.std())
+
+    for _ in range(passes):
+        changed = False
+        for name in thresholds:
+            values = np.unique([statistics[name] for statistics, labels in samples])
+            # Thresholds beyond the observed values switch the decision off or on for every image; the
+            # statistics are never negative
+            outside = max(values[-1] - values[0], 1.0)
+            candidates = np.concatenate([[max(values[0] - outside, 0.0)], (values[1:] + values[:-1]) / 2,
+                                         [values[-1] + outside]])
+            best = agreement(samples, thresholds)
+            for candidate in candidates:
+                trial = dict(thresholds)
+                trial[name] = float(candidate), thresholds[name][1]
+                score = agreement(samples, trial)
+                if score > best:
+                    best, thresholds, changed = score, trial, True
+        if not changed:
+            break
+
+    return thresholds
+
+
+def no_engine():
+    return None
+
+
+def label_image(engine, image_file):
+    image = cv2.imread(os.path.join(image_folder, image_file), cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        return image_file, None, None, None
+
+    statistics = image_statistics(image)
+    labels, confidence = choose_labels(statistics)
+
+    return image_file, labels, confidence, statistics
+
+
+if __name__ == '__main__':
+    image_labels = load_image_labels(json_file_path) if os.path.exists(json_file_path) else {}
+
+    all_files = [image_file for image_file in sorted(os.listdir(image_folder))
+                 if image_file.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    image_files = [image_file for image_file in all_files if overwrite_labels or image_file not in image_labels]
+    print(f"Labelling {len(image_files)} images")
+
+    # Images still waiting for review from earlier runs stay on the list
+    review = []
+    if os.path.exists(review_file_path):
+        with open(review_file_path, 'r') as review_file:
+            review = [entry for entry in json.load(review_file) if entry['image'] not in image_files]
+    pending = {entry['image'] for entry in review}
+
+    # The labelled images are read as well, to measure the agreement with them and calibrate the thresholds
+    image_statistics_by_file = {}
+    for image_file, labels, confidence, statistics in run_pool(all_files, no_engine, label_image, workers,
+                                                               chunksize=16):
+        if labels is None:
+            print(f"Failed to load image: {image_file}")
+            continue
+        image_statistics_by_file[image_file] = statistics
+
+    # Labels still waiting for review are not used as a reference
+    samples = [(image_statistics_by_file[image_file], image_labels[image_file])
+               for image_file in all_files if image_file in image_statistics_by_file and image_file in image_labels
+               and image_file not in pending]
+    thresholds = default_thresholds()
+    if samples:
+        print(f"Agreement with the {len(samples)} labelled images: {agreement(samples, thresholds)}")
+        if calibrate_thresholds:
+            thresholds = calibrate(samples, thresholds)
+            # Each image scored with thresholds calibrated on the others, an estimate for images not yet labelled
+            held_out = sum(agreement([sample], calibrate(samples[:index] + samples[index + 1:], thresholds))
+                           for index, sample in enumerate(samples))
+            print(f"Agreement after calibration: {agreement(samples, thresholds)}, {held_out} when each image is "
+                  f"left out of the calibration")
+            for name, (threshold, distance) in thresholds.items():
+                print(f"  {name}: threshold {threshold:.3g}, certain at {distance:.3g}")
+
+    for image_file in image_files:
+        if image_file not in image_statistics_by_file:
+            continue
+        statistics = image_statistics_by_file[image_file]
+        labels, confidence = choose_labels(statistics, thresholds)
+
+        image_labels[image_file] = labels
+        if confidence < review_confidence:
+            review.append({'image': image_file, 'labels': labels, 'confidence': confidence,
+                           'statistics': statistics})
+
+    with open(json_file_path, 'w') as json_file:
+        json.dump(image_labels, json_file, indent=4)
+
+    with open(review_file_path, 'w') as review_file:
+        json.dump(review, review_file, indent=4)
+
+    print(f"Labels saved in file {json_file_path}")
+    print(f"{len(review)} images with a confidence below {review_confidence} listed in {review_file_path}")
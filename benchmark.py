@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import cv2
+import numpy as np
+from multiprocessing import get_context
+from ocr_pool import limit_threads
+from ocr_engines import engine_scripts, load_engine_script, create_engine, read_single, read_batch
+from ocr_timing import peak_rss_mb
+from preprocessing import image_folder as dataset_folder, json_file_path as labels_file
+from preprocessing import load_image_labels, select_preprocessing
+
+# Every engine is benchmarked in a fresh process, so its cold start includes importing the framework
+# and its memory footprint is not mixed up with the other engines
+engines = list(engine_scripts)
+
+baseline_file = 'results/benchmark_baseline.json'
+latest_file = 'results/benchmark_latest.json'
+# Store this run as the new baseline instead of comparing it against the baseline
+save_baseline = False
+# Slowdown in ms/image against the baseline that counts as a regression
+regression_threshold = 0.2
+
+# Fixed thread count, warmup and repeats keep runs on the same machine comparable
+threads = 1
+warmup = 1
+repeats = 3
+
+# Synthetic label images (width, height), rendered from a fixed seed so every run reads the same images
+synthetic_sizes = [(320, 240), (640, 480), (1280, 960), (2560, 1920)]
+synthetic_seed = 0
+synthetic_words = ['BATCH', 'LOT', 'EXP', '2024', 'NET', 'WT', '500g', 'MADE', 'IN', 'ORIGIN', 'No.', '0417']
+
+
+def write_synthetic_images(folder):
+    random = np.random.default_rng(synthetic_seed)
+    items = []
+    for width, height in synthetic_sizes:
+        image = np.full((height, width, 3), 255, dtype=np.uint8)
+        scale = height / 240
+        line_height = int(40 * scale)
+        for y in range(line_height, height - line_height // 2, line_height):
+            text = " ".join(random.choice(synthetic_words, size=3))
+            cv2.putText(image, text, (int(10 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0),
+                        max(1, int(2 * scale)), cv2.LINE_AA)
+
+        image_path = os.path.join(folder, f"synthetic_{width}x{height}.png")
+        cv2.imwrite(image_path, image)
+        items.append(((image_path, None), f"Synthetic {width}x{height}"))
+
+    return items
+
+
+def dataset_items():
+    # The dataset images are preprocessed in memory like the OCR scripts do, grouped by their preprocessing label
+    image_labels = load_image_labels(labels_file)
+    items = []
+    for image_file in sorted(os.listdir(dataset_folder)):
+        if not image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        labels = image_labels.get(image_file, [])
+        label, steps = select_preprocessing(labels)
+        items.append(((os.path.join(dataset_folder, image_file), labels), label or 'No preprocessing'))
+
+    return items
+
+
+def latency_stats(milliseconds):
+    p50, p95 = np.percentile(milliseconds, [50, 95])
+
+    return {'mean_ms': float(np.mean(milliseconds)), 'p50_ms': float(p50), 'p95_ms': float(p95)}
+
+
+def benchmark_engine(engine_name, items):
+    limit_threads(threads)
+
+    start = time.perf_counter()
+    module = load_engine_script(engine_name)
+    import_seconds = time.perf_counter() - start
+    engine = create_engine(module)
+    cold_start_seconds = time.perf_counter() - start
+    loaded_rss = peak_rss_mb()
+
+    for _ in range(warmup):
+        read_single(module, engine, items[0][0])
+
+    groups = {}
+    for item, group in items:
+        groups.setdefault(group, []).append(item)
+
+    errors = 0
+    report = {}
+    for group, group_items in groups.items():
+        # Warm single-image latency: every image on its own, repeated
+        latencies = []
+        for item in group_items:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                result, error = read_single(module, engine, item)
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += error is not None
+
+        # Batch throughput: the whole group at once, best of the repeats
+        batch_seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            read_batch(module, engine, group_items)
+            batch_seconds.append(time.perf_counter() - start)
+        best = min(batch_seconds)
+
+        report[group] = {
+            'images': len(group_items),
+            'latency': latency_stats(latencies),
+            'images_per_second': len(group_items) / best if best > 0 else None,
+            'ms_per_image': best * 1000 / len(group_items),
+        }
+
+    all_items = [item for item, group in items]
+    start = time.perf_counter()
+    read_batch(module, engine, all_items)
+    total_seconds = time.perf_counter() - start
+
+    return {
+        'config': module.engine_config,
+        'import_seconds': import_seconds,
+        'cold_start_seconds': cold_start_seconds,
+        'loaded_rss_mb': loaded_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'images_per_second': len(all_items) / total_seconds if total_seconds > 0 else None,
+        'ms_per_image': total_seconds * 1000 / len(all_items),
+        'errors': errors,
+        'labels': report,
+    }
+
+
+def environment():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': sys.version.split()[0],
+        'threads': threads,
+        'warmup': warmup,
+        'repeats': repeats,
+    }
+
+
+def run_benchmark(items):
+    results = {}
+    context = get_context('spawn')
+    for engine_name in engines:
+        print(f"Benchmarking {engine_name}...")
+        with context.Pool(1) as pool:
+            try:
+                results[engine_name] = pool.apply(benchmark_engine, (engine_name, items))
+            except Exception as e:
+                # An engine that is not installed is reported, the others still run
+                results[engine_name] = {'error': str(e)}
+
+    return {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'environment': environment(), 'engines': results}
+
+
+def format_report(benchmark):
+    lines = []
+    for engine_name, result in benchmark['engines'].items():
+        if 'error' in result:
+            lines.append(f"{engine_name}: failed ({result['error']})\n")
+            continue
+
+        lines.append(
+            f"{engine_name}: cold start {result['cold_start_seconds']:.2f} s "
+            f"(import {result['import_seconds']:.2f} s), {result['images_per_second']:.2f} images/s, "
+            f"{result['ms_per_image']:.1f} ms/image"
+            + (f", peak RSS {result['peak_rss_mb']:.1f} MB\n" if result['peak_rss_mb'] is not None else "\n")
+        )
+        for label, stats in result['labels'].items():
+            lines.append(
+                f"  {label}: p50 {stats['latency']['p50_ms']:.1f} ms, p95 {stats['latency']['p95_ms']:.1f} ms, "
+                f"batch {stats['ms_per_image']:.1f} ms/image ({stats['images']} images)\n"
+            )
+
+    return "".join(lines)
+
+
+def compare_to_baseline(benchmark, baseline):
+    # Engines and labels whose ms/image grew by more than regression_threshold against the baseline
+    regressions = []
+    for engine_name, result in benchmark['engines'].items():
+        base = baseline['engines'].get(engine_name)
+        if base is None or 'error' in base or 'error' in result:
+            continue
+
+        pairs = [('all images', result, base)]
+        pairs += [(label, stats, base['labels'][label])
+                  for label, stats in result['labels'].items() if label in base['labels']]
+        for label, current, previous in pairs:
+            ratio = current['ms_per_image'] / previous['ms_per_image']
+            if ratio > 1 + regression_threshold:
+                regressions.append(
+                    f"{engine_name} {label}: {previous['ms_per_image']:.1f} -> {current['ms_per_image']:.1f} "
+                    f"ms/image ({(ratio - 1) * 100:+.0f}%)\n"
+                )
+
+    return regressions
+
+
+def save_benchmark(path, benchmark):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(benchmark, f, indent=4)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as synthetic_folder:
+        benchmark = run_benchmark(dataset_items() + write_synthetic_images(synthetic_folder))
+
+    print(format_report(benchmark))
+
+    if save_baseline or not os.path.exists(baseline_file):
+        save_benchmark(baseline_file, benchmark)
+        print(f"Baseline saved to {baseline_file}")
+    else:
+        save_benchmark(latest_file, benchmark)
+        with open(baseline_file, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        if baseline['environment'] != benchmark['environment']:
+            print("The baseline was measured in a different environment, the comparison is only indicative")
+
+        regressions = compare_to_baseline(benchmark, baseline)
+        for regression in regressions:
+            print(f"Regression: {regression}", end="")
+        if not regressions:
+            print("No regressions against the baseline")
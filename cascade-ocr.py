@@ -0,0 +1,278 @@
+import os
+import sys
+import numpy as np
+from collections import Counter
+from ocr_pool import run_pool, report_engine_load
+from ocr import evaluate_engine
+from ocr_engines import load_engine_script, create_engine, recognize_batch
+from edit_distance import levenshtein
+from ocr_timing import timed
+from image_scaling import scaling_description, unscale_result
+from image_loader import single_image
+from ocr_layout import word_arrays, mean_confidence
+from preprocessing import load_scaled_image
+
+preprocessed_images_folder = 'processed_images'
+ground_truth_file = 'ground_truth'
+results_file = 'results/cascade_results.txt'
+structured_results_file = 'results/cascade_results.jsonl'
+# Only the images whose image, labels, preprocessing, engine or ground truth changed since the last run are read
+# and scored; the other results and the overall totals are kept in state_file (evaluation_state.py)
+incremental = False
+state_file = 'results/cascade_state.sqlite'
+run_summary_file = 'results/cascade_runs.jsonl'
+
+# 'cprofile' or 'pyinstrument' profiles the run into results/cascade_profile.prof or .html
+profiler = None
+profile_file = 'results/cascade_profile'
+
+# Read the images from vision_datasets/ and preprocess them in memory instead of reading processed_images/
+stream_preprocessing = True
+
+# The engines from the cheapest to the most expensive. Each image is read by the first engine; the result is
+# accepted when its mean word confidence reaches confidence_threshold, otherwise the next engine is tried.
+# An engine that reports no confidences (keras-ocr) is always accepted, so it only makes sense last
+tiers = ['tesseract', 'easyocr', 'keras-ocr']
+confidence_threshold = 0.8
+
+# Escalate only the words below the threshold, cropped from the image, while they are at most this share
+# of the words; beyond it the whole image goes to the next engine
+escalate_regions = True
+max_region_share = 0.5
+region_padding = 4
+
+# Read every image with every engine and vote on each word instead of stopping early
+vote = False
+
+# Every worker process loads the engines of the later tiers only when an image first needs them
+workers = os.cpu_count()
+threads_per_worker = 1
+
+# OCR results are cached by image content and engine configuration, so unchanged images are not read again
+use_cache = True
+
+
+def __getattr__(name):
+    # engine_config holds the configuration of every tier engine, so their scripts are only loaded when the key
+    # is needed, not whenever this script is imported (in every pool worker)
+    if name == 'engine_config':
+        globals()['engine_config'] = {
+            'engine': 'cascade', 'tiers': tiers,
+            'tier_configs': {tier: load_engine_script(tier).engine_config for tier in tiers},
+            'confidence_threshold': confidence_threshold, 'escalate_regions': escalate_regions,
+            'max_region_share': max_region_share, 'region_padding': region_padding, 'vote': vote,
+            'scaling': scaling_description(),
+        }
+        return globals()['engine_config']
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def create_cascade():
+    # The engines are created on first use, by tier name
+    return {}
+
+
+def tier_engine(cascade, tier):
+    if tier not in cascade:
+        module = load_engine_script(tier)
+        cascade[tier] = module, create_engine(module)
+
+    return cascade[tier]
+
+
+def recognize_with(cascade, tier, images, timings):
+    # Runs one engine over the images; the time is added to timings as '<tier>'
+    module, engine = tier_engine(cascade, tier)
+    image_timings = [{} for _ in images]
+    with timed(timings, tier):
+        return recognize_batch(module, engine, images, image_timings)
+
+
+def result_confidence(value):
+    # Mean word confidence weighted by word length; None when the engine reports no confidences
+    return mean_confidence(value.get('boxes', []))
+
+
+def reading_score(value):
+    # Characters the reading is expected to get right: word lengths weighted by their confidence, so a reading
+    # of one confident word doesn't win over a full reading; None when the engine reports no confidences
+    points, texts, confidences = word_arrays(value.get('boxes', []))
+    if np.isnan(confidences).any():
+        return None
+
+    return float(np.dot([len(text) for text in texts], confidences)) if texts else 0.0
+
+
+def crop_word(image, box):
+    points = np.asarray(box, dtype=float).reshape(-1, 2)
+    x0, y0 = np.maximum(points.min(axis=0).astype(int) - region_padding, 0)
+    x1, y1 = points.max(axis=0).astype(int) + region_padding + 1
+
+    return np.ascontiguousarray(image[y0:y1, x0:x1])
+
+
+def escalate_words(cascade, tier, image, value, timings):
+    # Reads the low-confidence words again with the next engine and keeps the more confident reading
+    words = value['boxes']
+    low = [index for index, (box, text, confidence) in enumerate(words)
+           if confidence is not None and confidence < confidence_threshold]
+    crops = [crop_word(image, words[index][0]) for index in low]
+
+    for index, (crop_value, error) in zip(low, recognize_with(cascade, tier, crops, timings)):
+        if crop_value is None or not crop_value['text'].strip():
+            continue
+        confidence = result_confidence(crop_value)
+        if confidence is None or confidence > words[index][2]:
+            words[index] = [words[index][0], crop_value['text'].strip(), confidence]
+
+    value['text'] = " ".join(text for box, text, confidence in words)
+
+    return value
+
+
+def reading_words(value):
+    # The words of a reading with the index of the box they are in; None when the engine gave no boxes
+    if not value.get('boxes'):
+        return [(word, None) for word in value['text'].split()]
+
+    return [(word, index) for index, (box, text, confidence) in enumerate(value['boxes']) for word in text.split()]
+
+
+def word_distance(word, other):
+    return levenshtein(word, other) / max(len(word), len(other))
+
+
+def align_words(reference, words):
+    # Edit alignment of two word sequences as (reference index, word index) pairs with None for a gap;
+    # substituting a word costs its character edit distance over its length, so misread words still pair up
+    reference, words = [word.lower() for word in reference], [word.lower() for word in words]
+    costs = np.zeros((len(reference) + 1, len(words) + 1))
+    costs[:, 0], costs[0, :] = np.arange(len(reference) + 1), np.arange(len(words) + 1)
+    for i in range(1, len(reference) + 1):
+        for j in range(1, len(words) + 1):
+            costs[i, j] = min(costs[i - 1, j - 1] + word_distance(reference[i - 1], words[j - 1]),
+                              costs[i - 1, j] + 1, costs[i, j - 1] + 1)
+
+    pairs = []
+    i, j = len(reference), len(words)
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and costs[i, j] == costs[i - 1, j - 1] + word_distance(reference[i - 1], words[j - 1]):
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i > 0 and costs[i, j] == costs[i - 1, j] + 1:
+            pairs.append((i - 1, None))
+            i -= 1
+        else:
+            pairs.append((None, j - 1))
+            j -= 1
+
+    return pairs[::-1]
+
+
+def vote_words(values):
+    # Merges the readings word by word: every reading is aligned to the positions found so far, and words no
+    # earlier reading has at their place open a new position. A position is kept when at least half of the
+    # readings have a word there, and it takes the most frequent word; ties go to the most confident reading
+    ranked = sorted(values, key=lambda value: reading_score(value) or 0, reverse=True)
+
+    # Every position holds (reading, word, box index) of the readings that have a word there
+    positions = []
+    for reading, value in enumerate(ranked):
+        words = reading_words(value)
+        pairs = align_words([position[0][1] for position in positions], [word for word, index in words])
+        merged = []
+        for i, j in pairs:
+            position = positions[i] if i is not None else []
+            if j is not None:
+                position.append((reading, *words[j]))
+            merged.append(position)
+        positions = merged
+
+    chosen = []
+    for position in positions:
+        if 2 * len(position) < len(ranked):
+            continue
+        counts = Counter(word.lower() for reading, word, index in position)
+        best = max(counts.values())
+        chosen.append(next(entry for entry in position if counts[entry[1].lower()] == best))
+
+    # The boxes of the chosen words; consecutive words from the same box stay in one box
+    boxes, previous = [], None
+    for reading, word, index in chosen:
+        if index is None:
+            previous = None
+            continue
+        if (reading, index) == previous:
+            boxes[-1][1] += " " + word
+        else:
+            box, text, confidence = ranked[reading]['boxes'][index]
+            boxes.append([box, word, confidence])
+        previous = (reading, index)
+
+    return {'text': " ".join(word for reading, word, index in chosen), 'boxes': boxes}
+
+
+def recognize_cascade(cascade, image, timings):
+    if vote:
+        results = [recognize_with(cascade, tier, [image], timings)[0] for tier in tiers]
+        values = [value for value, error in results if value is not None]
+        if not values:
+            return results[0]
+        value = vote_words(values)
+        value['tier'] = 'vote'
+        return value, None
+
+    value, error = None, None
+    for tier in tiers:
+        if value is not None and escalate_regions and value.get('boxes'):
+            low = sum(confidence < confidence_threshold for box, text, confidence in value['boxes'])
+            if low <= max_region_share * len(value['boxes']):
+                value = escalate_words(cascade, tier, image, value, timings)
+                value['tier'] = tier
+                confidence = result_confidence(value)
+                if confidence is None or confidence >= confidence_threshold:
+                    return value, None
+                continue
+
+        tier_value, error = recognize_with(cascade, tier, [image], timings)[0]
+        if tier_value is None:
+            continue
+
+        # The next engine's reading replaces the previous one only when it is expected to get more characters
+        # right; an engine without confidences is always taken
+        score = reading_score(tier_value)
+        if value is None or score is None or score > reading_score(value):
+            value = tier_value
+        # The last engine that was tried, whether its reading was kept or not
+        value['tier'] = tier
+
+        confidence = result_confidence(value)
+        if confidence is None or confidence >= confidence_threshold:
+            return value, None
+
+    return (value, None) if value is not None else (None, error)
+
+
+def read_image(cascade, item):
+    image_path, labels = item
+    timings = {}
+    report_engine_load(timings)
+    image, scale = load_scaled_image(image_path, labels, timings)
+    if image is None:
+        return None, f"Failed to load image: {image_path}"
+
+    value, error = recognize_cascade(cascade, image, timings)
+    if value is not None:
+        value['text'] = value['text'].replace('\n', ' ')
+        value['timings'] = timings
+
+    return unscale_result((value, error), scale)
+
+
+def read_images(items):
+    return run_pool(items, create_cascade, read_image, workers, threads_per_worker, item_paths=single_image)
+
+
+if __name__ == '__main__':
+    evaluate_engine(sys.modules[__name__])
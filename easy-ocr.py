@@ -1,142 +1,103 @@
 import os
-import easyocr
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from difflib import SequenceMatcher
-import re
+import sys
+from importlib.metadata import version
+from ocr_pool import run_pool, report_engine_load
+from ocr import evaluate_engine
+from ocr_timing import timed
+from text_regions import pack_text_regions, unpack_result
+from image_scaling import scaling_description, recognize_tiled, unscale_result
+from onnx_backend import onnx_description
+from image_loader import single_image
+from preprocessing import load_scaled_image, to_rgb
 
 preprocessed_images_folder = 'processed_images/'
 ground_truth_file = 'ground_truth'
 results_file = 'results/easyocr_results.txt'
+structured_results_file = 'results/easyocr_results.jsonl'
+# Only the images whose image, labels, preprocessing, engine or ground truth changed since the last run are read
+# and scored; the other results and the overall totals are kept in state_file (evaluation_state.py)
+incremental = False
+state_file = 'results/easyocr_state.sqlite'
+run_summary_file = 'results/easyocr_runs.jsonl'
 
-reader = easyocr.Reader(['en'], gpu=False)
+# 'cprofile' or 'pyinstrument' profiles the run into results/easyocr_profile.prof or .html
+profiler = None
+profile_file = 'results/easyocr_profile'
 
+# Read the images from vision_datasets/ and preprocess them in memory instead of reading processed_images/
+stream_preprocessing = True
 
-def load_ground_truth(ground_truth_file):
-    ground_truth = {}
-    current_image = None
-    with open(ground_truth_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('#'):
-                current_image = line[2:].strip()
-                ground_truth[current_image] = ""
-            elif current_image:
-                ground_truth[current_image] += line + "\n"
-
-    for image in ground_truth:
-        ground_truth[image] = ground_truth[image].strip()
+# Every worker process builds its own reader; threads_per_worker keeps the workers from oversubscribing the cores
+workers = os.cpu_count()
+threads_per_worker = 1
 
-    return ground_truth
-
-
-def extract_chars(text):
-    return re.sub(r'\s+', '', text)
-
-
-def calculate_similarity(ocr_text, ground_truth_text):
-    ocr_text = extract_chars(ocr_text.lower())
-    ground_truth_text = extract_chars(ground_truth_text.lower())
-
-    return SequenceMatcher(None, ocr_text, ground_truth_text).ratio()
-
-
-def calculate_metrics(ocr_text, ground_truth_text):
-    ocr_chars = list(extract_chars(ocr_text.lower()))
-    ground_truth_chars = list(extract_chars(ground_truth_text.lower()))
-
-    min_len = min(len(ocr_chars), len(ground_truth_chars))
-    ocr_chars = ocr_chars[:min_len]
-    ground_truth_chars = ground_truth_chars[:min_len]
-    max_len = max(len(ocr_chars), len(ground_truth_chars))
-
-    if max_len == 0:
-        return 0, 0, 0, 0
-
-    accuracy = accuracy_score(ground_truth_chars, ocr_chars)
-    precision = precision_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    recall = recall_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    f1 = f1_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-
-    return accuracy, precision, recall, f1
-
-
-def perform_ocr_evaluation(images_folder, ground_truth_data, results_file):
-    total_accuracy = 0
-    total_precision = 0
-    total_recall = 0
-    total_f1 = 0
-    total_images = 0
-
-    with open(results_file, 'w', encoding='utf-8') as f:
-        for image_file in os.listdir(images_folder):
-            if image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-
-                image_path = os.path.join(images_folder, image_file)
-
-                if not os.path.exists(image_path):
-                    output = f"Image not found: {image_path}. Skipping...\n"
-                    print(output)
-                    f.write(output)
-                    continue
-
-                if image_file in ground_truth_data:
-                    ground_truth_text = ground_truth_data[image_file]
-
-                    try:
-                        result = reader.readtext(image_path, detail=0)
-                        ocr_text = " ".join(result).replace('\n', ' ')
-                    except Exception as e:
-                        output = f"Error processing {image_file}: {e}\n"
-                        print(output)
-                        f.write(output)
-                        continue
-
-                    similarity = calculate_similarity(ocr_text, ground_truth_text)
-                    accuracy, precision, recall, f1 = calculate_metrics(ocr_text, ground_truth_text)
-
-                    output = (
-                        f"Image: {image_file}\n"
-                        f"OCR Result: {ocr_text}\n"
-                        f"Ground Truth: {ground_truth_text}\n"
-                        f"Similarity: {similarity * 100:.2f}%\n"
-                        f"Accuracy: {accuracy * 100:.2f}%\n"
-                        f"Precision: {precision * 100:.2f}%\n"
-                        f"Recall: {recall * 100:.2f}%\n"
-                        f"F1-Score: {f1 * 100:.2f}%\n"
-                        + "-" * 40 + "\n"
-                    )
-
-                    print(output)
-                    f.write(output)
-
-                    total_accuracy += accuracy
-                    total_precision += precision
-                    total_recall += recall
-                    total_f1 += f1
-                    total_images += 1
-                else:
-                    output = f"No ground truth found for {image_file}. Skipping...\n"
-                    print(output)
-                    f.write(output)
-
-        if total_images > 0:
-            overall_accuracy = total_accuracy / total_images
-            overall_precision = total_precision / total_images
-            overall_recall = total_recall / total_images
-            overall_f1 = total_f1 / total_images
-
-            overall_output = (
-                f"Overall Accuracy: {overall_accuracy * 100:.2f}%\n"
-                f"Overall Precision: {overall_precision * 100:.2f}%\n"
-                f"Overall Recall: {overall_recall * 100:.2f}%\n"
-                f"Overall F1-Score: {overall_f1 * 100:.2f}%\n"
-            )
-            print(overall_output)
-            f.write(overall_output)
-        else:
-            print("No images processed.")
-            f.write("No images processed.\n")
-
-
-ground_truth_data = load_ground_truth(ground_truth_file)
-perform_ocr_evaluation(preprocessed_images_folder, ground_truth_data, results_file)
+# Only the detected text regions are recognized, packed into one smaller image; boxes are mapped back
+crop_text_regions = False
+
+# OCR results are cached by image content and engine configuration, so unchanged images are not read again
+use_cache = True
+reader_options = {'lang_list': ['en'], 'gpu': False}
+
+# Run the detector and recognizer on ONNX Runtime (onnx_backend.py) instead of PyTorch
+use_onnx = False
+
+engine_config = {'engine': 'easyocr', 'version': version('easyocr'), 'options': reader_options,
+                 'crop_text_regions': crop_text_regions, 'scaling': scaling_description()}
+if use_onnx:
+    engine_config['onnx'] = onnx_description()
+
+
+def create_reader(onnx=None):
+    # easyocr and PyTorch are imported on first use, so a run with nothing to read doesn't load them
+    import easyocr
+
+    if not (use_onnx if onnx is None else onnx):
+        return easyocr.Reader(**reader_options)
+
+    # The models are exported from the full-precision weights; ONNX Runtime quantizes them itself
+    from onnx_backend import use_onnx_easyocr
+
+    return use_onnx_easyocr(easyocr.Reader(**reader_options, quantize=False))
+
+
+def recognize_image(reader, image, timings):
+    from easyocr.utils import reformat_input
+
+    try:
+        # Same steps as Reader.readtext, with detection and recognition timed separately
+        with timed(timings, 'detection'):
+            img, img_cv_grey = reformat_input(to_rgb(image))
+            horizontal_list, free_list = reader.detect(img, reformat=False)
+        with timed(timings, 'recognition'):
+            result = reader.recognize(img_cv_grey, horizontal_list[0], free_list[0], reformat=False)
+        return {
+            'text': " ".join([text for box, text, confidence in result]).replace('\n', ' '),
+            'boxes': [[[[float(x), float(y)] for x, y in box], text, float(confidence)]
+                      for box, text, confidence in result],
+            'timings': timings,
+        }, None
+    except Exception as e:
+        return None, str(e)
+
+
+def read_image(reader, item):
+    image_path, labels = item
+    timings = {}
+    report_engine_load(timings)
+    image, scale = load_scaled_image(image_path, labels, timings)
+    if image is None:
+        return None, f"Failed to load image: {image_path}"
+
+    placements = None
+    if crop_text_regions:
+        image, placements = pack_text_regions(image, timings)
+
+    return unscale_result(unpack_result(recognize_tiled(recognize_image, reader, image, timings), placements), scale)
+
+
+def read_images(items):
+    return run_pool(items, create_reader, read_image, workers, threads_per_worker, item_paths=single_image)
+
+
+if __name__ == '__main__':
+    evaluate_engine(sys.modules[__name__])
@@ -0,0 +1,104 @@
+import math
+
+
+def levenshtein(reference, hypothesis):
+    # Bit-parallel edit distance (Myers/Hyyrö): one column of the DP matrix is kept in the bits of an integer,
+    # so every element of the hypothesis costs a few integer operations instead of a full column
+    if len(reference) < len(hypothesis):
+        reference, hypothesis = hypothesis, reference
+
+    length = len(reference)
+    if length == 0:
+        return len(hypothesis)
+
+    # The last row of the last column: row 0 costs len(hypothesis), every row below adds its vertical delta
+    positive_vertical, negative_vertical = (1 << length) - 1, 0
+    for positive_vertical, negative_vertical in vertical_deltas(reference_masks(reference), length, hypothesis):
+        pass
+
+    return len(hypothesis) + positive_vertical.bit_count() - negative_vertical.bit_count()
+
+
+def reference_masks(reference):
+    # The bits of the rows where each element occurs
+    match_masks = {}
+    for index, element in enumerate(reference):
+        match_masks[element] = match_masks.get(element, 0) | (1 << index)
+
+    return match_masks
+
+
+def vertical_deltas(match_masks, length, hypothesis, start=None):
+    # The bit-parallel columns of the DP matrix with the reference (length elements) along the bits: yields for
+    # every element of the hypothesis the rows where the cost goes up by one and where it goes down by one from
+    # the row above. start is the column before the first element, column 0 by default
+    mask = (1 << length) - 1
+    positive_vertical, negative_vertical = (mask, 0) if start is None else start
+
+    for element in hypothesis:
+        matches = match_masks.get(element, 0)
+        vertical = matches | negative_vertical
+        horizontal = (((matches & positive_vertical) + positive_vertical) ^ positive_vertical) | matches
+        positive_horizontal = (negative_vertical | ~(horizontal | positive_vertical)) & mask
+        negative_horizontal = positive_vertical & horizontal
+
+        positive_horizontal = ((positive_horizontal << 1) | 1) & mask
+        negative_horizontal = (negative_horizontal << 1) & mask
+        positive_vertical = (negative_horizontal | ~(vertical | positive_horizontal)) & mask
+        negative_vertical = positive_horizontal & vertical
+        yield positive_vertical, negative_vertical
+
+
+def align(reference, hypothesis):
+    # Returns the edit alignment as (reference index, hypothesis index) pairs, with None on the side of an
+    # insertion or deletion. The path is traced back through the bit-parallel columns, one bit per cell. Only
+    # every block-th column is kept from the forward pass; the columns of a block are computed again when the
+    # path reaches it, so memory grows with the square root of the hypothesis length, not with its square
+    block = max(64, math.isqrt(len(hypothesis)))
+    match_masks, length = reference_masks(reference), len(reference)
+    checkpoints = [((1 << length) - 1, 0)]
+    for j, column in enumerate(vertical_deltas(match_masks, length, hypothesis), 1):
+        if j % block == 0:
+            checkpoints.append(column)
+
+    # Columns start to start + block of the block the path is in
+    columns = {}
+
+    def column(j):
+        if j not in columns:
+            start = j // block * block
+            columns.clear()
+            columns[start] = checkpoints[start // block]
+            for offset, deltas in enumerate(vertical_deltas(match_masks, length, hypothesis[start:start + block],
+                                                            columns[start]), start + 1):
+                columns[offset] = deltas
+        return columns[j]
+
+    def cost(i, j):
+        # Row 0 of column j costs j, every row below adds its vertical delta
+        positive_vertical, negative_vertical = column(j)
+        rows = (1 << i) - 1
+        return j + (positive_vertical & rows).bit_count() - (negative_vertical & rows).bit_count()
+
+    pairs = []
+    i, j = len(reference), len(hypothesis)
+    current = cost(i, j)
+    while i > 0 and j > 0:
+        positive_vertical, negative_vertical = column(j)
+        diagonal = cost(i - 1, j - 1)
+        above = current - ((positive_vertical >> (i - 1)) & 1) + ((negative_vertical >> (i - 1)) & 1)
+        if diagonal + (reference[i - 1] != hypothesis[j - 1]) == current:
+            pairs.append((i - 1, j - 1))
+            i, j, current = i - 1, j - 1, diagonal
+        elif above + 1 == current:
+            pairs.append((i - 1, None))
+            i, current = i - 1, above
+        else:
+            pairs.append((None, j - 1))
+            j, current = j - 1, current - 1
+
+    pairs.extend((row, None) for row in reversed(range(i)))
+    pairs.extend((None, column) for column in reversed(range(j)))
+    pairs.reverse()
+
+    return pairs
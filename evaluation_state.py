@@ -0,0 +1,166 @@
+import os
+import json
+import sqlite3
+import hashlib
+from ocr_metrics import empty_statistics, add_statistics, statistics_version
+from results_store import new_run_id, make_row, append_rows
+from ocr_timing import timed, latency_summary, format_latency_summary
+from ocr_cache import open_cache, hash_file, cache_key, run_cached
+from ocr_evaluation import score_text, format_result, format_totals, image_items, write_text
+from preprocessing import preprocessing_description
+
+# Incremental evaluation keeps the result of every image with a fingerprint of everything it depends on:
+# the image content, its labels and their preprocessing steps, the engine configuration and the ground-truth
+# entry. A run reads and scores only the images whose fingerprint changed, and the corpus totals are updated
+# by removing the old counts of those images and adding the new ones
+
+
+def open_state(path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS images (image TEXT PRIMARY KEY, fingerprint TEXT, size INTEGER, '
+        'mtime_ns INTEGER, image_hash TEXT, output TEXT, statistics TEXT)'
+    )
+    connection.execute('CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value TEXT)')
+    # States written before the image paths were kept
+    if 'path' not in [row[1] for row in connection.execute('PRAGMA table_info(images)')]:
+        connection.execute('ALTER TABLE images ADD COLUMN path TEXT')
+
+    return connection
+
+
+def load_totals(connection):
+    row = connection.execute("SELECT value FROM totals WHERE name = 'corpus'").fetchone()
+
+    return empty_statistics() if row is None else json.loads(row[0])
+
+
+def save_totals(connection, totals):
+    connection.execute("INSERT OR REPLACE INTO totals (name, value) VALUES ('corpus', ?)", (json.dumps(totals),))
+
+
+def fingerprint(key, ground_truth_text):
+    # The OCR cache key already covers the image hash, the preprocessing and the engine configuration
+    return hashlib.sha256(json.dumps([key, ground_truth_text, statistics_version]).encode('utf-8')).hexdigest()
+
+
+def current_hash(known, image_path):
+    # Files with the size and modification time of the last run are not read again
+    stat = os.stat(image_path)
+    if known is not None and known[1] == stat.st_size and known[2] == stat.st_mtime_ns:
+        return known[3], stat
+
+    return hash_file(image_path), stat
+
+
+def remove_image(connection, totals, image_file, known):
+    if image_file not in known:
+        return
+
+    statistics = connection.execute('SELECT statistics FROM images WHERE image = ?', (image_file,)).fetchone()[0]
+    add_statistics(totals, json.loads(statistics), sign=-1)
+    connection.execute('DELETE FROM images WHERE image = ?', (image_file,))
+
+
+def evaluate_incrementally(image_paths, ground_truth_data, image_labels, engine_config, read_images, results_file,
+                           structured_results_file, state_file, use_cache=True, output_format='both'):
+    # Same results as ocr_evaluation.evaluate; the structured results only get rows for the images that were
+    # scored again, and the text results are rebuilt from the stored ones
+    connection = open_state(state_file)
+    totals = load_totals(connection)
+    known = {row[0]: row for row in
+             connection.execute('SELECT image, size, mtime_ns, image_hash, fingerprint, path FROM images')}
+
+    selected = {os.path.basename(image_path): image_path for image_path in image_paths}
+    image_paths = [image_path for image_path in image_paths
+                   if os.path.basename(image_path) in ground_truth_data and os.path.exists(image_path)]
+    labels = image_items(image_paths, image_labels)
+
+    # Images whose file was deleted or whose ground truth was removed leave the totals; images that are only
+    # outside this run's selection keep their results
+    for image_file in set(known) - {os.path.basename(image_path) for image_path in image_paths}:
+        image_path = selected.get(image_file, known[image_file][5])
+        if image_file not in ground_truth_data or (image_path is not None and not os.path.exists(image_path)):
+            remove_image(connection, totals, image_file, known)
+
+    dirty = []
+    for image_path in image_paths:
+        image_file = os.path.basename(image_path)
+        image_hash, stat = current_hash(known.get(image_file), image_path)
+        key = cache_key(image_hash, preprocessing_description(labels[image_path]), engine_config)
+        image_fingerprint = fingerprint(key, ground_truth_data[image_file])
+        if image_file in known and known[image_file][4] == image_fingerprint:
+            continue
+        dirty.append((image_file, image_path, key, image_fingerprint, image_hash, stat))
+
+    print(f"Scoring {len(dirty)} of {len(image_paths)} images, the others are unchanged")
+
+    cache = open_cache() if use_cache else None
+    keys = {image_path: key for image_file, image_path, key, *rest in dirty}
+    ocr_results = run_cached(cache, [image_path for image_file, image_path, *rest in dirty], keys,
+                             lambda paths: read_images([(path, labels[path]) for path in paths]))
+
+    run_id = new_run_id()
+    rows = []
+    per_image_timings = []
+    errors = []
+    try:
+        for (image_file, image_path, key, image_fingerprint, image_hash, stat), (ocr_result, error) \
+                in zip(dirty, ocr_results):
+            remove_image(connection, totals, image_file, known)
+            if error is not None:
+                # Not stored, so the image is read again next run
+                errors.append(f"Error processing {image_file}: {error}\n")
+                print(errors[-1])
+                continue
+
+            ground_truth_text = ground_truth_data[image_file]
+            ocr_text = ocr_result['text']
+            timings = {} if ocr_result.get('cached') else dict(ocr_result.get('timings', {}))
+            with timed(timings, 'metrics'):
+                metrics, statistics = score_text(ocr_text, ground_truth_text)
+
+            output = format_result(image_file, ocr_text, ground_truth_text, metrics)
+            print(output)
+
+            add_statistics(totals, statistics)
+            connection.execute(
+                'INSERT OR REPLACE INTO images (image, fingerprint, size, mtime_ns, image_hash, output, statistics, '
+                'path) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (image_file, image_fingerprint, stat.st_size, stat.st_mtime_ns, image_hash, output,
+                 json.dumps(statistics), image_path)
+            )
+            rows.append(make_row(run_id, engine_config, image_file, ocr_result, ground_truth_text, metrics, timings))
+            per_image_timings.append(timings)
+    finally:
+        ocr_results.close()
+        if cache is not None:
+            cache.close()
+
+    save_totals(connection, totals)
+    connection.commit()
+
+    outputs = [output for (output,) in connection.execute('SELECT output FROM images ORDER BY image')] + errors
+    connection.close()
+
+    if totals['images'] > 0:
+        overall_output = (
+            format_totals(totals)
+            + f"Images scored in this run: {len(rows)} of {totals['images']}\n"
+            + format_latency_summary(latency_summary(per_image_timings))
+        )
+    else:
+        overall_output = "No images processed.\n"
+    print(overall_output)
+    outputs.append(overall_output)
+
+    if output_format in ('text', 'both'):
+        write_text(results_file, outputs)
+    if output_format in ('jsonl', 'both'):
+        append_rows(structured_results_file, rows)
+
+    return totals
@@ -0,0 +1,161 @@
+import os
+import re
+import glob
+import itertools
+import sqlite3
+import hashlib
+from collections.abc import Mapping
+from multiprocessing import Pool
+
+# The ground truth is parsed once into a SQLite index and looked up by image name, so a run over a large
+# corpus never holds all of it in memory. The index is rebuilt for the shards whose size or modification
+# time changed. ground_truth_file can be one file, a folder of shard files, or a glob pattern; each image
+# belongs to one shard
+index_folder = 'cache'
+
+# Changed shards are parsed in this many processes; 1 parses them in this process
+parse_workers = os.cpu_count()
+
+# Entries are written to the index in batches of this size
+insert_batch = 10000
+
+
+def parse_ground_truth(lines):
+    # Yields (image name, text) for every "# imgN" header and the lines that follow it
+    current_image = None
+    text_lines = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#'):
+            if current_image:
+                yield current_image, "\n".join(text_lines).strip()
+            current_image = line[2:].strip()
+            text_lines = []
+        elif current_image:
+            text_lines.append(line)
+
+    if current_image:
+        yield current_image, "\n".join(text_lines).strip()
+
+
+def shard_batches(path):
+    # Yields the entries of a shard in lists of at most insert_batch, reading the file as they are consumed
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = parse_ground_truth(f)
+        while True:
+            batch = list(itertools.islice(entries, insert_batch))
+            if not batch:
+                return
+            yield batch
+
+
+def parse_shard(path):
+    # A worker process returns the whole shard, already split into batches
+    return list(shard_batches(path))
+
+
+def ground_truth_shards(ground_truth_file):
+    if os.path.isdir(ground_truth_file):
+        return sorted(os.path.join(ground_truth_file, name) for name in os.listdir(ground_truth_file)
+                      if os.path.isfile(os.path.join(ground_truth_file, name)))
+    if os.path.exists(ground_truth_file):
+        return [ground_truth_file]
+
+    return sorted(path for path in glob.glob(ground_truth_file, recursive=True) if os.path.isfile(path))
+
+
+def index_path(ground_truth_file):
+    # One index for every ground-truth source
+    name = re.sub(r'[^\w.-]', '', os.path.basename(os.path.normpath(ground_truth_file))) or 'ground_truth'
+    digest = hashlib.sha256(os.path.abspath(ground_truth_file).encode('utf-8')).hexdigest()[:12]
+
+    return os.path.join(index_folder, f'ground_truth_{name}_{digest}.sqlite')
+
+
+def open_index(path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE IF NOT EXISTS entries (image TEXT PRIMARY KEY, shard TEXT, text TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS entries_shard ON entries (shard)')
+    connection.execute('CREATE TABLE IF NOT EXISTS shards (shard TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)')
+
+    return connection
+
+
+def update_index(connection, shards):
+    # Parses the shards that are new or changed since the index was built and drops the ones that are gone
+    known = {row[0]: row[1:] for row in connection.execute('SELECT shard, size, mtime_ns FROM shards')}
+    stats = {shard: os.stat(shard) for shard in shards}
+    changed = [shard for shard in shards if known.get(shard) != (stats[shard].st_size, stats[shard].st_mtime_ns)]
+
+    for shard in set(known) - set(shards):
+        connection.execute('DELETE FROM entries WHERE shard = ?', (shard,))
+        connection.execute('DELETE FROM shards WHERE shard = ?', (shard,))
+
+    if changed:
+        workers = max(1, min(parse_workers or 1, len(changed)))
+        if workers == 1:
+            # In this process every shard is streamed, so only one batch of it is held at a time
+            parsed = map(shard_batches, changed)
+        else:
+            pool = Pool(workers)
+            parsed = pool.imap(parse_shard, changed)
+
+        try:
+            for shard, batches in zip(changed, parsed):
+                connection.execute('DELETE FROM entries WHERE shard = ?', (shard,))
+                for entries in batches:
+                    rows = [(image, shard, text) for image, text in entries]
+                    connection.executemany('INSERT OR REPLACE INTO entries (image, shard, text) VALUES (?, ?, ?)', rows)
+                connection.execute('INSERT OR REPLACE INTO shards (shard, size, mtime_ns) VALUES (?, ?, ?)',
+                                   (shard, stats[shard].st_size, stats[shard].st_mtime_ns))
+        finally:
+            if workers > 1:
+                pool.close()
+                pool.join()
+
+    connection.commit()
+
+    return len(changed)
+
+
+class GroundTruthIndex(Mapping):
+    # Read-only mapping from image name to ground-truth text; every lookup is one query on the index
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    def __getitem__(self, image_file):
+        row = self.connection.execute('SELECT text FROM entries WHERE image = ?', (image_file,)).fetchone()
+        if row is None:
+            raise KeyError(image_file)
+
+        return row[0]
+
+    def __contains__(self, image_file):
+        return self.connection.execute('SELECT 1 FROM entries WHERE image = ?', (image_file,)).fetchone() is not None
+
+    def __iter__(self):
+        # Image names in sorted order
+        for (image_file,) in self.connection.execute('SELECT image FROM entries ORDER BY image'):
+            yield image_file
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def load_ground_truth(ground_truth_file):
+    # Returns the indexed ground truth of the file, folder or glob pattern, updating the index first
+    path = index_path(ground_truth_file)
+    connection = open_index(path)
+    update_index(connection, ground_truth_shards(ground_truth_file))
+    connection.close()
+
+    return GroundTruthIndex(path)
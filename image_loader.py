@@ -0,0 +1,96 @@
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from ocr_timing import timed
+
+# While a worker recognizes one image, the next prefetch_depth images are read and decoded on loader_threads
+# threads, so the engine doesn't wait on the disk or the JPEG decoder. Reading and decoding release the GIL
+prefetch_depth = 4
+loader_threads = 2
+
+# 2, 4 or 8 decodes the images at 1/2, 1/4 or 1/8 of their size (JPEGs are scaled down while they are decoded,
+# which is much faster than decoding at full size); 1 decodes at full size
+reduced_decode = 1
+
+reduced_flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+executor = None
+executor_pid = None
+# Decodes in flight by image path; never more than prefetch_depth
+pending = {}
+
+
+def loader_description():
+    # Part of the engines' cache keys when the images are decoded at a reduced size
+    return {'reduced_decode': reduced_decode} if reduced_decode != 1 else {}
+
+
+def read_image_file(image_path):
+    # Returns the decoded image or None, its scale against the file, and the timings of the read and decode
+    timings = {}
+    try:
+        with timed(timings, 'read'):
+            data = np.fromfile(image_path, dtype=np.uint8)
+    except OSError:
+        return None, 1.0, timings
+
+    with timed(timings, 'decode'):
+        image = cv2.imdecode(data, reduced_flags[reduced_decode])
+
+    return image, 1.0 / reduced_decode, timings
+
+
+def prefetch(image_paths):
+    # Starts reading the images that are not in flight yet, up to prefetch_depth at a time
+    global executor, executor_pid
+
+    if prefetch_depth <= 0:
+        return
+    # A forked worker inherits the executor but not its threads, so it starts its own
+    if executor is None or executor_pid != os.getpid():
+        executor = ThreadPoolExecutor(loader_threads, thread_name_prefix='image-loader')
+        executor_pid = os.getpid()
+        pending.clear()
+
+    for image_path in image_paths:
+        if len(pending) >= prefetch_depth:
+            break
+        if image_path not in pending:
+            pending[image_path] = executor.submit(read_image_file, image_path)
+
+
+def take_image(image_path, timings):
+    # The prefetched image when it was started, otherwise it is read now; returns the image and its scale
+    future = pending.pop(image_path, None)
+    if future is None:
+        image, scale, load_timings = read_image_file(image_path)
+    else:
+        with timed(timings, 'load_wait'):
+            image, scale, load_timings = future.result()
+
+    timings.update(load_timings)
+
+    return image, scale
+
+
+def prefetched(items, item_paths):
+    # Yields the items in order and starts loading the images of the items that follow;
+    # item_paths(item) lists the images an item reads
+    items = list(items)
+    for index, item in enumerate(items):
+        upcoming = [image_path for following in items[index + 1:index + 1 + prefetch_depth]
+                    for image_path in item_paths(following)]
+        # Images an earlier item started but never took would hold their place in the queue
+        wanted = set(item_paths(item)) | set(upcoming)
+        for image_path in [image_path for image_path in pending if image_path not in wanted]:
+            pending.pop(image_path).cancel()
+
+        prefetch(upcoming)
+        yield item
+
+
+def single_image(item):
+    # Items that are (image path, ...) tuples
+    return [item[0]]
@@ -0,0 +1,188 @@
+import cv2
+import numpy as np
+from ocr_timing import timed
+from image_loader import loader_description
+
+# Images larger than max_image_pixels are always scaled down, so time and memory per image don't grow with
+# the camera
+max_image_pixels = 8_000_000
+
+# With rescale_images, images are also scaled so that their text is about target_text_height pixels high, which
+# is what the engines read best. It changes what every engine reads, so it is off until its effect on the scores
+# has been measured
+rescale_images = False
+target_text_height = 32
+# Above 1, images with small text are enlarged as well; that costs time and the estimate is noisy on small text
+max_upscale = 1.0
+
+# The text height is measured on a copy scaled down to at most estimate_size pixels on its longer side
+estimate_size = 1024
+min_characters = 5
+
+# Images larger than max_tile_side are recognized in overlapping tiles; the overlap has to fit a whole word
+max_tile_side = 2048
+tile_overlap = 192
+
+
+def scaling_description():
+    # Part of the engines' cache keys, so changing a setting reads the images again
+    return {'rescale': rescale_images, 'text_height': target_text_height, 'max_upscale': max_upscale,
+            'max_pixels': max_image_pixels, 'tile_side': max_tile_side, 'tile_overlap': tile_overlap,
+            **loader_description()}
+
+
+def estimate_text_height(image):
+    # Median height of the character-sized connected components of the binarized image, or None without text
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    scale = min(1.0, estimate_size / max(height, width))
+    if scale < 1:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Text is the smaller class, whichever its polarity
+    if np.count_nonzero(binary) > binary.size / 2:
+        cv2.bitwise_not(binary, binary)
+
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths, heights, areas = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    characters = (heights >= 4) & (heights < gray.shape[0] * 0.2) & (areas >= 8) & (widths < heights * 4)
+    if np.count_nonzero(characters) < min_characters:
+        return None
+
+    return float(np.median(heights[characters])) / scale
+
+
+def rescale_image(image, timings=None):
+    # Returns the rescaled image and its scale against the decoded image
+    if timings is None:
+        timings = {}
+
+    with timed(timings, 'rescale'):
+        height, width = image.shape[:2]
+        scale = 1.0
+        if rescale_images:
+            text_height = estimate_text_height(image)
+            scale = 1.0 if text_height is None else min(max_upscale, target_text_height / text_height)
+            # Small changes are not worth the resampling
+            if abs(scale - 1) < 0.1:
+                scale = 1.0
+
+        # The pixel cap applies whether or not the text height is targeted
+        scale = min(scale, (max_image_pixels / (height * width)) ** 0.5)
+        if scale == 1:
+            return image, 1.0
+
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        return cv2.resize(image, size, interpolation=interpolation), scale
+
+
+def scale_boxes(boxes, scale):
+    if scale == 1:
+        return boxes
+
+    return [[(np.asarray(box, dtype=float) / scale).tolist(), text, confidence] for box, text, confidence in boxes]
+
+
+def unscale_result(result, scale):
+    # Maps the boxes of an OCR result on the rescaled image back to the decoded image
+    value, error = result
+    if value is not None and scale != 1:
+        value['boxes'] = scale_boxes(value.get('boxes', []), scale)
+
+    return value, error
+
+
+def tile_origins(length):
+    if length <= max_tile_side:
+        return [0]
+
+    step = max_tile_side - tile_overlap
+    origins = list(range(0, length - max_tile_side, step))
+
+    return origins + [length - max_tile_side]
+
+
+def split_tiles(image):
+    # Returns (tile, (x, y)) views of the image; a small image is a single tile
+    height, width = image.shape[:2]
+
+    return [(np.ascontiguousarray(image[y:y + max_tile_side, x:x + max_tile_side]), (x, y))
+            for y in tile_origins(height) for x in tile_origins(width)]
+
+
+def box_area(points):
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+
+    return max(0.0, x1 - x0) * max(0.0, y1 - y0)
+
+
+def overlap_share(a, b):
+    # Intersection of the bounding rectangles over the smaller one
+    x0, y0 = np.maximum(a.min(axis=0), b.min(axis=0))
+    x1, y1 = np.minimum(a.max(axis=0), b.max(axis=0))
+    intersection = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    smaller = min(box_area(a), box_area(b))
+
+    return intersection / smaller if smaller > 0 else 0.0
+
+
+def reading_order(boxes):
+    # Sorts the boxes into lines by their vertical centers, then left to right
+    if not boxes:
+        return boxes
+
+    points = [np.asarray(box, dtype=float).reshape(-1, 2) for box, text, confidence in boxes]
+    heights = [p[:, 1].max() - p[:, 1].min() for p in points]
+    line_height = max(1.0, float(np.median(heights)))
+    keys = [(round(p[:, 1].mean() / line_height), p[:, 0].min()) for p in points]
+
+    return [box for key, box in sorted(zip(keys, boxes), key=lambda pair: pair[0])]
+
+
+def merge_tile_results(results, origins):
+    # Moves the boxes of every tile to image coordinates and drops the copies of words read twice in an
+    # overlap, keeping the larger (uncut) box. The text is rebuilt from the words in reading order
+    errors = [error for value, error in results if error is not None]
+    if len(errors) == len(results):
+        return None, errors[0]
+
+    candidates = []
+    timings = {}
+    for (value, error), (x, y) in zip(results, origins):
+        if value is None:
+            continue
+        for stage, seconds in value.get('timings', {}).items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        for box, text, confidence in value.get('boxes', []):
+            points = np.asarray(box, dtype=float).reshape(-1, 2) + (x, y)
+            candidates.append((points, text, confidence))
+
+    # Larger boxes first, then higher confidence, so a cut copy is the one that is dropped
+    candidates.sort(key=lambda candidate: (box_area(candidate[0]), candidate[2] or 0), reverse=True)
+    kept = []
+    for points, text, confidence in candidates:
+        if all(overlap_share(points, other) <= 0.5 for other, _, _ in kept):
+            kept.append((points, text, confidence))
+
+    boxes = reading_order([[points.tolist(), text, confidence] for points, text, confidence in kept])
+
+    return {'text': " ".join(text for box, text, confidence in boxes), 'boxes': boxes, 'timings': timings}, None
+
+
+def recognize_tiled(recognize, engine, image, timings):
+    # recognize(engine, image, timings) -> (value, error); large images are recognized tile by tile
+    tiles = split_tiles(image)
+    if len(tiles) == 1:
+        return recognize(engine, image, timings)
+
+    results = [recognize(engine, tile, {}) for tile, origin in tiles]
+    value, error = merge_tile_results(results, [origin for tile, origin in tiles])
+    if value is not None:
+        for stage, seconds in value['timings'].items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        value['timings'] = timings
+
+    return value, error
@@ -1,138 +1,204 @@
 import os
-import keras_ocr
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from difflib import SequenceMatcher
-import re
+import sys
+import numpy as np
+from importlib.metadata import version
+from ocr_pool import run_pool, report_engine_load
+from ocr import evaluate_engine
+from ocr_timing import timed
+from text_regions import pack_text_regions, unpack_result
+from image_scaling import scaling_description, split_tiles, merge_tile_results, unscale_result
+from onnx_backend import onnx_description
+from image_loader import prefetched, single_image
+from preprocessing import load_scaled_image, to_rgb
 
 preprocessed_images_folder = 'processed_images/'
 ground_truth_file = 'ground_truth'
 results_file = 'results/keras_ocr_results.txt'
+structured_results_file = 'results/keras_ocr_results.jsonl'
+# Only the images whose image, labels, preprocessing, engine or ground truth changed since the last run are read
+# and scored; the other results and the overall totals are kept in state_file (evaluation_state.py)
+incremental = False
+state_file = 'results/keras_ocr_state.sqlite'
+run_summary_file = 'results/keras_ocr_runs.jsonl'
 
-pipeline = keras_ocr.pipeline.Pipeline()
+# 'cprofile' or 'pyinstrument' profiles the run into results/keras_ocr_profile.prof or .html
+profiler = None
+profile_file = 'results/keras_ocr_profile'
 
+# Read the images from vision_datasets/ and preprocess them in memory instead of reading processed_images/
+stream_preprocessing = True
 
-def load_ground_truth(ground_truth_file):
-    ground_truth = {}
-    current_image = None
-    with open(ground_truth_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('#'):
-                current_image = line[2:].strip()
-                ground_truth[current_image] = ""
-            elif current_image:
-                ground_truth[current_image] += line + "\n"
+# Images are recognized together in batches; images whose resized shapes fall
+# into the same bucket are batched together to keep padding small
+batch_size = 8
+bucket_size = 256
+window_size = batch_size * 4
 
-    for image in ground_truth:
-        ground_truth[image] = ground_truth[image].strip()
+# Every worker process builds its own pipeline and recognizes one window of images at a time
+workers = os.cpu_count()
+threads_per_worker = 1
 
-    return ground_truth
+# Only the detected text regions are recognized, packed into one smaller image; boxes are mapped back
+crop_text_regions = False
 
+# OCR results are cached by image content and engine configuration, so unchanged images are not read again
+use_cache = True
 
-def extract_chars(text):
-    return re.sub(r'\s+', '', text)
+# Run the detector and recognizer on ONNX Runtime (onnx_backend.py) instead of TensorFlow
+use_onnx = False
 
+engine_config = {'engine': 'keras-ocr', 'version': version('keras-ocr'), 'options': {},
+                 'crop_text_regions': crop_text_regions, 'scaling': scaling_description()}
+if use_onnx:
+    engine_config['onnx'] = onnx_description()
 
-def calculate_similarity(ocr_text, ground_truth_text):
-    ocr_text = extract_chars(ocr_text.lower())
-    ground_truth_text = extract_chars(ground_truth_text.lower())
 
-    return SequenceMatcher(None, ocr_text, ground_truth_text).ratio()
+def create_pipeline(onnx=None):
+    # keras_ocr and TensorFlow are imported on first use, so a run with nothing to read doesn't load them
+    import keras_ocr
 
+    pipeline = keras_ocr.pipeline.Pipeline()
+    if not (use_onnx if onnx is None else onnx):
+        return pipeline
 
-def calculate_metrics(ocr_text, ground_truth_text):
-    ocr_chars = list(extract_chars(ocr_text.lower()))
-    ground_truth_chars = list(extract_chars(ground_truth_text.lower()))
+    from onnx_backend import use_onnx_keras_ocr
 
-    min_len = min(len(ocr_chars), len(ground_truth_chars))
-    ocr_chars = ocr_chars[:min_len]
-    ground_truth_chars = ground_truth_chars[:min_len]
+    return use_onnx_keras_ocr(pipeline)
 
-    max_len = max(len(ocr_chars), len(ground_truth_chars))
 
-    if max_len == 0:
-        return 0, 0, 0, 0
+def bucket_key(pipeline, img):
+    height, width = img.shape[:2]
+    if max(height, width) * pipeline.scale > pipeline.max_size:
+        scale = pipeline.max_size / max(height, width)
+    else:
+        scale = pipeline.scale
 
-    accuracy = accuracy_score(ground_truth_chars, ocr_chars)
-    precision = precision_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    recall = recall_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    f1 = f1_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
+    return -(-int(height * scale) // bucket_size), -(-int(width * scale) // bucket_size)
 
-    return accuracy, precision, recall, f1
 
+def make_batches(pipeline, images):
+    buckets = {}
+    for index, img in enumerate(images):
+        buckets.setdefault(bucket_key(pipeline, img), []).append(index)
 
-def perform_ocr_evaluation(images_folder, ground_truth_data, results_file):
-    total_accuracy = 0
-    total_precision = 0
-    total_recall = 0
-    total_f1 = 0
-    total_images = 0
+    batches = []
+    for key in sorted(buckets):
+        indices = buckets[key]
+        for start in range(0, len(indices), batch_size):
+            batches.append(indices[start:start + batch_size])
 
-    with open(results_file, 'w', encoding='utf-8') as f:
-        for image_file in os.listdir(images_folder):
-            if image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(images_folder, image_file)
+    return batches
 
-                if not os.path.exists(image_path):
-                    result = f"Image not found: {image_path}. Skipping...\n"
-                    print(result)
-                    f.write(result)
-                    continue
 
-                if image_file in ground_truth_data:
-                    ground_truth_text = ground_truth_data[image_file]
+def recognize_batch(pipeline, images, timings):
+    # Same steps as Pipeline.recognize, with detection and recognition timed separately
+    import keras_ocr
 
-                    img = keras_ocr.tools.read(image_path)
-                    prediction_groups = pipeline.recognize([img])
+    resized = [keras_ocr.tools.resize_image(image, max_scale=pipeline.scale, max_size=pipeline.max_size)
+               for image in images]
+    max_height, max_width = np.array([image.shape[:2] for image, scale in resized]).max(axis=0)
+    padded = np.array([keras_ocr.tools.pad(image, width=max_width, height=max_height) for image, scale in resized])
 
-                    ocr_text = " ".join([text for text, box in prediction_groups[0]])
+    with timed(timings, 'detection'):
+        box_groups = pipeline.detector.detect(images=padded)
+    with timed(timings, 'recognition'):
+        prediction_groups = pipeline.recognizer.recognize_from_boxes(images=padded, box_groups=box_groups)
 
-                    similarity = calculate_similarity(ocr_text, ground_truth_text)
-                    accuracy, precision, recall, f1 = calculate_metrics(ocr_text, ground_truth_text)
+    box_groups = [
+        keras_ocr.tools.adjust_boxes(boxes=boxes, boxes_format='boxes', scale=1 / scale) if scale != 1 else boxes
+        for (image, scale), boxes in zip(resized, box_groups)
+    ]
 
-                    result = (
-                            f"Image: {image_file}\n"
-                            f"OCR Result: {ocr_text}\n"
-                            f"Ground Truth: {ground_truth_text}\n"
-                            f"Similarity: {similarity * 100:.2f}%\n"
-                            f"Accuracy: {accuracy * 100:.2f}%\n"
-                            f"Precision: {precision * 100:.2f}%\n"
-                            f"Recall: {recall * 100:.2f}%\n"
-                            f"F1-Score: {f1 * 100:.2f}%\n"
-                            + "-" * 40 + "\n"
-                    )
+    return [list(zip(predictions, boxes)) for predictions, boxes in zip(prediction_groups, box_groups)]
 
-                    print(result)
-                    f.write(result)
 
-                    total_accuracy += accuracy
-                    total_precision += precision
-                    total_recall += recall
-                    total_f1 += f1
-                    total_images += 1
-                else:
-                    result = f"No ground truth found for {image_file}. Skipping...\n"
-                    print(result)
-                    f.write(result)
-
-        if total_images > 0:
-            overall_accuracy = total_accuracy / total_images
-            overall_precision = total_precision / total_images
-            overall_recall = total_recall / total_images
-            overall_f1 = total_f1 / total_images
+def recognize_batched(pipeline, images, timings):
+    prediction_groups = [None] * len(images)
+    for batch in make_batches(pipeline, images):
+        batch_predictions = recognize_batch(pipeline, [images[index] for index in batch], timings)
+        for index, predictions in zip(batch, batch_predictions):
+            prediction_groups[index] = predictions
 
-            overall_result = (
-                f"Overall Accuracy: {overall_accuracy * 100:.2f}%\n"
-                f"Overall Precision: {overall_precision * 100:.2f}%\n"
-                f"Overall Recall: {overall_recall * 100:.2f}%\n"
-                f"Overall F1-Score: {overall_f1 * 100:.2f}%\n"
-            )
-            print(overall_result)
-            f.write(overall_result)
+    return prediction_groups
+
+
+def recognize_window(pipeline, images, image_timings):
+    # The images of a window are recognized together, so each gets an equal share of the time
+    window_timings = {}
+    prediction_groups = recognize_batched(pipeline, [to_rgb(image) for image in images], window_timings)
+
+    results = []
+    for predictions, timings in zip(prediction_groups, image_timings):
+        for stage, seconds in window_timings.items():
+            timings[stage] = seconds / len(images)
+
+        results.append(({
+            'text': " ".join([text for text, box in predictions]),
+            'boxes': [[box.tolist(), text, None] for text, box in predictions],
+            'timings': timings,
+        }, None))
+
+    return results
+
+
+def recognize_tiled_window(pipeline, images, image_timings):
+    # Images larger than a tile are split into overlapping tiles; all tiles of the window are batched together
+    tiles = [split_tiles(image) for image in images]
+    tile_images = [tile for image_tiles in tiles for tile, origin in image_tiles]
+    tile_timings = [{} for _ in tile_images]
+    tile_results = iter(recognize_window(pipeline, tile_images, tile_timings))
+
+    results = []
+    for image_tiles, timings in zip(tiles, image_timings):
+        image_results = [next(tile_results) for _ in image_tiles]
+        if len(image_tiles) == 1:
+            value, error = image_results[0]
+        else:
+            value, error = merge_tile_results(image_results, [origin for tile, origin in image_tiles])
+        if value is not None:
+            for stage, seconds in value['timings'].items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+            value['timings'] = timings
+        results.append((value, error))
+
+    return results
+
+
+def read_window(pipeline, items):
+    image_timings = [{} for _ in items]
+    report_engine_load(image_timings[0])
+    # The whole window is recognized at once, so its images are prefetched while the earlier ones are preprocessed
+    images = [load_scaled_image(image_path, labels, timings)
+              for (image_path, labels), timings in zip(prefetched(items, single_image), image_timings)]
+    loaded = [(image, scale, timings) for (image, scale), timings in zip(images, image_timings) if image is not None]
+    placements = [None] * len(loaded)
+    if crop_text_regions:
+        packed = [pack_text_regions(image, timings) for image, scale, timings in loaded]
+        loaded = [(image, scale, timings) for (image, _), (_, scale, timings) in zip(packed, loaded)]
+        placements = [image_placements for _, image_placements in packed]
+
+    window_results = recognize_tiled_window(pipeline, [image for image, scale, timings in loaded],
+                                            [timings for image, scale, timings in loaded])
+    recognized = iter([unscale_result(unpack_result(result, image_placements), scale)
+                       for result, image_placements, (image, scale, timings)
+                       in zip(window_results, placements, loaded)])
+
+    results = []
+    for (image_path, labels), (image, scale) in zip(items, images):
+        if image is None:
+            results.append((None, f"Failed to load image: {image_path}"))
         else:
-            print("No images processed.")
-            f.write("No images processed.\n")
+            results.append(next(recognized))
+
+    return results
+
+
+def read_images(items):
+    windows = [items[start:start + window_size] for start in range(0, len(items), window_size)]
+    for window_results in run_pool(windows, create_pipeline, read_window, workers, threads_per_worker):
+        for result in window_results:
+            yield result
 
 
-ground_truth_data = load_ground_truth(ground_truth_file)
-perform_ocr_evaluation(preprocessed_images_folder, ground_truth_data, results_file)
+if __name__ == '__main__':
+    evaluate_engine(sys.modules[__name__])
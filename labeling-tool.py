@@ -6,12 +6,37 @@ import matplotlib.pyplot as plt
 image_folder = 'vision_datasets'
 output_directory = 'image_labels'
 json_file_path = os.path.join(output_directory, 'image_labels.json')
+review_file_path = os.path.join(output_directory, 'review.json')
+
+# With a review list from auto-labeling.py only its low-confidence images are shown, otherwise every image is
+review_only = True
+
+label_names = {
+    '1': 'Blur-High-Contrast',
+    '2': 'Handwriting',
+    '3': 'White Background',
+    '4': 'Same Back Stylewriting',
+    '5': 'White on Black',
+}
 
 if not os.path.exists(output_directory):
     os.makedirs(output_directory)
 
-image_files = os.listdir(image_folder)
+# New labels are merged into the existing file
 image_labels = {}
+if os.path.exists(json_file_path):
+    with open(json_file_path, 'r') as json_file:
+        image_labels = json.load(json_file)
+
+review = None
+if review_only and os.path.exists(review_file_path):
+    with open(review_file_path, 'r') as review_file:
+        review = json.load(review_file)
+
+if review is not None:
+    image_files = [entry['image'] for entry in review]
+else:
+    image_files = os.listdir(image_folder)
 
 
 def show_image(image_path):
@@ -32,32 +57,30 @@ for image_file in image_files:
     show_image(image_path)
 
     print("Select one or more labels for the image (separate numbers with a space):")
-    print("1: Blur-High-Contrast")
-    print("2: Handwriting")
-    print("3: White Background")
-    print("4: Same Back Stylewriting")
-    print("5: White on Black")
+    for number, label in label_names.items():
+        print(f"{number}: {label}")
+
+    suggested = image_labels.get(image_file)
+    if suggested is not None:
+        print(f"Current labels: {', '.join(suggested)} (press Enter to keep them)")
 
     labels_input = input("Enter label numbers separated by space: ")
 
     label_numbers = labels_input.split()
-
-    labels = []
-    for number in label_numbers:
-        if number == '1':
-            labels.append('Blur-High-Contrast')
-        elif number == '2':
-            labels.append('Handwriting')
-        elif number == '3':
-            labels.append('White Background')
-        elif number == '4':
-            labels.append('Same Back Stylewriting')
-        elif number == '5':
-            labels.append('White on Black')
+    if not label_numbers and suggested is not None:
+        labels = suggested
+    else:
+        labels = [label_names[number] for number in label_numbers if number in label_names]
 
     image_labels[image_file] = labels
 
-with open(json_file_path, 'w') as json_file:
-    json.dump(image_labels, json_file, indent=4)
+    # Saved after every image, so the review can be stopped and continued later
+    with open(json_file_path, 'w') as json_file:
+        json.dump(image_labels, json_file, indent=4)
+
+    if review is not None:
+        review = [entry for entry in review if entry['image'] != image_file]
+        with open(review_file_path, 'w') as review_file:
+            json.dump(review, review_file, indent=4)
 
 print(f"Labels saved in file {json_file_path}")
@@ -0,0 +1,73 @@
+import sys
+import argparse
+from ocr_engines import engine_scripts, combined_scripts, load_engine_script
+from ground_truth_index import load_ground_truth
+from ocr_evaluation import list_images, expand_inputs, evaluate, output_formats
+from evaluation_state import evaluate_incrementally
+from ocr_timing import profiled
+from preprocessing import image_folder as dataset_folder, json_file_path as labels_file, load_image_labels
+
+# One entry point for every engine: python ocr.py --engine tesseract easyocr --input "vision_datasets/*.jpg"
+# Each engine script (easy-ocr.py, keras-ocr.py, tesseract-ocr.py, cascade-ocr.py) provides create and read
+# functions and its settings; running a script on its own is the same as naming only that engine here
+
+
+def evaluate_engine(module, image_paths=None, output_format='both', incremental=None):
+    # The script's settings choose the images, the ground truth, the cache and the result files
+    with profiled(module.profiler, module.profile_file):
+        ground_truth_data = load_ground_truth(module.ground_truth_file)
+        if module.stream_preprocessing:
+            image_labels = load_image_labels(labels_file)
+            images_folder = dataset_folder
+        else:
+            image_labels = None
+            images_folder = module.preprocessed_images_folder
+        if image_paths is None:
+            image_paths = list_images(images_folder)
+
+        if module.incremental if incremental is None else incremental:
+            return evaluate_incrementally(image_paths, ground_truth_data, image_labels, module.engine_config,
+                                          module.read_images, module.results_file, module.structured_results_file,
+                                          module.state_file, module.use_cache, output_format)
+
+        return evaluate(image_paths, ground_truth_data, image_labels, module.engine_config, module.read_images,
+                        module.results_file, module.structured_results_file, module.run_summary_file,
+                        module.use_cache, output_format)
+
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(description="Reads images with OCR engines and scores them on the ground truth")
+    parser.add_argument('--engine', nargs='+', default=['tesseract'],
+                        choices=list(engine_scripts) + list(combined_scripts), help="engines to run, one after another")
+    parser.add_argument('--input', nargs='+', metavar='GLOB',
+                        help="image files, folders or glob patterns; the engine script's folder by default")
+    parser.add_argument('--workers', type=int, help="worker processes per engine; the script's setting by default")
+    parser.add_argument('--format', choices=output_formats, default='both',
+                        help="text results, structured .jsonl results, or both")
+    parser.add_argument('--incremental', action=argparse.BooleanOptionalAction,
+                        help="only read and score the images that changed since the last run")
+    parser.add_argument('--no-cache', action='store_true', help="read every image again instead of using the cache")
+
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    image_paths = expand_inputs(arguments.input) if arguments.input else None
+    if image_paths is not None and not image_paths:
+        print(f"No images match {' '.join(arguments.input)}")
+        return
+
+    for engine_name in arguments.engine:
+        module = load_engine_script(engine_name)
+        if arguments.workers is not None:
+            module.workers = arguments.workers
+        if arguments.no_cache:
+            module.use_cache = False
+
+        print(f"Evaluating {engine_name}")
+        evaluate_engine(module, image_paths, arguments.format, arguments.incremental)
+
+
+if __name__ == '__main__':
+    main()
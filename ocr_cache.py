@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+cache_file = os.path.join('cache', 'ocr_cache.sqlite')
+max_cache_size = 512 * 1024 * 1024
+# Reads and writes are committed together every commit_interval entries and at the end of a run
+commit_interval = 64
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def cache_key(image_hash, preprocessing, engine_config):
+    # preprocessing and engine_config are JSON-serializable descriptions (function name and parameters,
+    # engine name, version and reader options); changing any of them gives a different key
+    key = json.dumps([image_hash, preprocessing, engine_config], sort_keys=True)
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class CacheConnection(sqlite3.Connection):
+    # Keeps the total size of the entries, so a put doesn't sum the whole table, and counts the writes since
+    # the last commit, so they are committed in batches of commit_interval
+    total_size = 0
+    pending_writes = 0
+
+
+def open_cache(path=cache_file):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    connection = sqlite3.connect(path, factory=CacheConnection)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)'
+    )
+    connection.execute('CREATE INDEX IF NOT EXISTS ocr_cache_accessed ON ocr_cache (accessed)')
+    connection.total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM ocr_cache').fetchone()[0]
+
+    return connection
+
+
+def written(connection):
+    connection.pending_writes += 1
+    if connection.pending_writes >= commit_interval:
+        flush_cache(connection)
+
+
+def flush_cache(connection):
+    connection.commit()
+    connection.pending_writes = 0
+
+
+def cache_get(connection, key):
+    row = connection.execute('SELECT value FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+
+    connection.execute('UPDATE ocr_cache SET accessed = ? WHERE key = ?', (time.time(), key))
+    written(connection)
+
+    return json.loads(row[0])
+
+
+def cache_put(connection, key, value, max_size=max_cache_size):
+    data = json.dumps(value)
+    row = connection.execute('SELECT size FROM ocr_cache WHERE key = ?', (key,)).fetchone()
+    connection.execute(
+        'INSERT OR REPLACE INTO ocr_cache (key, value, size, accessed) VALUES (?, ?, ?, ?)',
+        (key, data, len(data), time.time())
+    )
+    connection.total_size += len(data) - (row[0] if row is not None else 0)
+    if connection.total_size > max_size:
+        evict(connection, max_size)
+    written(connection)
+
+
+def evict(connection, max_size):
+    # Drop the least recently used entries until the cache fits again
+    evicted = []
+    for key, size in connection.execute('SELECT key, size FROM ocr_cache ORDER BY accessed'):
+        if connection.total_size <= max_size:
+            break
+        evicted.append((key,))
+        connection.total_size -= size
+
+    connection.executemany('DELETE FROM ocr_cache WHERE key = ?', evicted)
+
+
+def run_cached(connection, image_paths, keys, read_images):
+    # read_images takes the list of paths that are not cached and yields (value, error) for them in order
+    cached = {}
+    if connection is not None:
+        for image_path in image_paths:
+            value = cache_get(connection, keys[image_path])
+            if value is not None:
+                cached[image_path] = value
+
+    results = read_images([image_path for image_path in image_paths if image_path not in cached])
+
+    try:
+        for image_path in image_paths:
+            if image_path in cached:
+                yield dict(cached[image_path], cached=True), None
+                continue
+
+            value, error = next(results)
+            if error is None and connection is not None:
+                cache_put(connection, keys[image_path], value)
+            yield value, error
+    finally:
+        # Closing this generator early also stops the workers behind the results that are still pending
+        if hasattr(results, 'close'):
+            results.close()
+        if connection is not None:
+            flush_cache(connection)
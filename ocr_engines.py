@@ -0,0 +1,72 @@
+import os
+import sys
+import importlib
+import importlib.util
+
+# The OCR scripts are also used as engine modules: each has a create function, read functions for image paths
+# and recognize functions for images that are already decoded and preprocessed
+engine_scripts = {'easyocr': 'easy-ocr.py', 'keras-ocr': 'keras-ocr.py', 'tesseract': 'tesseract-ocr.py'}
+# Engines built from the other engines; they only read image paths, so the server and the benchmark leave them out
+combined_scripts = {'cascade': 'cascade-ocr.py'}
+
+
+
+def script_module_name(engine):
+    return engine.replace('-', '_') + '_script'
+
+
+class EngineScriptFinder:
+    # Imports the scripts as <engine>_script modules. Pool workers started with spawn (the default on Windows
+    # and macOS) import the functions they are sent by module name, so the names have to be importable there too
+    def find_spec(self, name, path=None, target=None):
+        scripts = {**engine_scripts, **combined_scripts}
+        for engine, script in scripts.items():
+            if script_module_name(engine) == name:
+                return importlib.util.spec_from_file_location(
+                    name, os.path.join(os.path.dirname(os.path.abspath(__file__)), script))
+
+        return None
+
+
+if not any(isinstance(finder, EngineScriptFinder) for finder in sys.meta_path):
+    sys.meta_path.append(EngineScriptFinder())
+
+
+def load_engine_script(engine):
+    if engine not in engine_scripts and engine not in combined_scripts:
+        raise KeyError(engine)
+
+    return importlib.import_module(script_module_name(engine))
+
+
+def create_engine(module):
+    if hasattr(module, 'create_reader'):
+        return module.create_reader()
+
+    return module.create_pipeline()
+
+
+def read_single(module, engine, item):
+    if hasattr(module, 'read_image'):
+        return module.read_image(engine, item)
+
+    return module.read_window(engine, [item])[0]
+
+
+def read_batch(module, engine, items):
+    # keras-ocr recognizes whole windows of images at once, the other engines read one image at a time
+    if hasattr(module, 'read_window'):
+        results = []
+        for start in range(0, len(items), module.window_size):
+            results.extend(module.read_window(engine, items[start:start + module.window_size]))
+        return results
+
+    return [module.read_image(engine, item) for item in items]
+
+
+def recognize_batch(module, engine, images, image_timings):
+    # Same as read_batch for decoded images; returns (value, error) for every image
+    if hasattr(module, 'recognize_window'):
+        return module.recognize_window(engine, images, image_timings)
+
+    return [module.recognize_image(engine, image, timings) for image, timings in zip(images, image_timings)]
@@ -0,0 +1,185 @@
+import os
+import glob
+from collections import Counter
+from ocr_metrics import extract_chars, text_statistics, empty_statistics, add_statistics, statistics_totals
+from results_store import new_run_id, make_row, make_run_summary, append_rows
+from ocr_timing import timed, latency_summary, format_latency_summary, peak_rss_mb, format_peak_rss
+from ocr_cache import open_cache, hash_file, cache_key, run_cached
+from preprocessing import preprocessing_description
+
+# The evaluation shared by every engine: the engine only provides read_images(items) and its engine_config,
+# everything else (ground truth, cache, metrics, result files) is the same for all of them
+image_extensions = ('.png', '.jpg', '.jpeg')
+
+# 'text' writes the readable results, 'jsonl' the structured rows and the run summary, 'both' writes all of them
+output_formats = ('text', 'jsonl', 'both')
+
+
+def list_images(folder):
+    return [os.path.join(folder, image_file) for image_file in sorted(os.listdir(folder))
+            if image_file.lower().endswith(image_extensions)]
+
+
+def expand_inputs(patterns):
+    # Image paths matching the glob patterns; a folder stands for the images in it
+    image_paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isdir(path):
+                image_paths.extend(list_images(path))
+            elif path.lower().endswith(image_extensions):
+                image_paths.append(path)
+
+    return list(dict.fromkeys(image_paths))
+
+
+def score_text(ocr_text, ground_truth_text):
+    # Returns (similarity, cer, wer, accuracy, precision, recall, f1) and the counts for the corpus totals;
+    # every score comes from one character and one word edit distance and one alignment
+    statistics = text_statistics(ocr_text, ground_truth_text)
+
+    ocr_chars = len(extract_chars(ocr_text.lower()))
+    length = max(statistics['chars'], ocr_chars)
+    similarity = 1 - statistics['char_edits'] / length if length else 1.0
+
+    ocr_words = len(ocr_text.split())
+    cer = statistics['char_edits'] / statistics['chars'] if statistics['chars'] else float(ocr_chars > 0)
+    wer = statistics['word_edits'] / statistics['words'] if statistics['words'] else float(ocr_words > 0)
+
+    return (similarity, cer, wer, *statistics['metric_sums']), statistics
+
+
+def format_result(image_file, ocr_text, ground_truth_text, metrics):
+    similarity, cer, wer, accuracy, precision, recall, f1 = metrics
+
+    return (
+        f"Image: {image_file}\n"
+        f"OCR Result: {ocr_text}\n"
+        f"Ground Truth: {ground_truth_text}\n"
+        f"Similarity: {similarity * 100:.2f}%\n"
+        f"CER: {cer * 100:.2f}%\n"
+        f"WER: {wer * 100:.2f}%\n"
+        f"Accuracy: {accuracy * 100:.2f}%\n"
+        f"Precision: {precision * 100:.2f}%\n"
+        f"Recall: {recall * 100:.2f}%\n"
+        f"F1-Score: {f1 * 100:.2f}%\n"
+        + "-" * 40 + "\n"
+    )
+
+
+def format_totals(totals):
+    # Averages of the per-image scores, then the corpus-level micro and macro totals over all characters
+    images = totals['images']
+    accuracy, precision, recall, f1 = (total / images for total in totals['metric_sums'])
+    corpus_cer, corpus_wer, corpus_totals = statistics_totals(totals)
+    micro, macro = corpus_totals['micro'], corpus_totals['macro']
+
+    return (
+        f"Overall Accuracy: {accuracy * 100:.2f}%\n"
+        f"Overall Precision: {precision * 100:.2f}%\n"
+        f"Overall Recall: {recall * 100:.2f}%\n"
+        f"Overall F1-Score: {f1 * 100:.2f}%\n"
+        f"Overall Micro F1-Score: {micro[3] * 100:.2f}%\n"
+        f"Overall Macro Precision: {macro[1] * 100:.2f}%\n"
+        f"Overall Macro Recall: {macro[2] * 100:.2f}%\n"
+        f"Overall Macro F1-Score: {macro[3] * 100:.2f}%\n"
+        f"Overall CER: {corpus_cer * 100:.2f}%\n"
+        f"Overall WER: {corpus_wer * 100:.2f}%\n"
+    )
+
+
+def format_tiers(tier_counts, images):
+    # Engines that combine others (cascade-ocr.py) report which of them settled each image
+    return "".join(f"Resolved by {tier}: {count / images * 100:.2f}%\n" for tier, count in tier_counts.items())
+
+
+def image_items(image_paths, image_labels):
+    # Without image_labels the images are already preprocessed, so their content hash covers the preprocessing
+    return {image_path: None if image_labels is None else image_labels.get(os.path.basename(image_path), [])
+            for image_path in image_paths}
+
+
+def evaluate(image_paths, ground_truth_data, image_labels, engine_config, read_images, results_file,
+             structured_results_file, run_summary_file, use_cache=True, output_format='both'):
+    run_id = new_run_id()
+    totals = empty_statistics()
+    tier_counts = Counter()
+    rows = []
+    per_image_timings = []
+    outputs = []
+
+    def report(output):
+        print(output)
+        outputs.append(output)
+
+    scored_paths = []
+    for image_path in image_paths:
+        if not os.path.exists(image_path):
+            report(f"Image not found: {image_path}. Skipping...\n")
+        elif os.path.basename(image_path) not in ground_truth_data:
+            report(f"No ground truth found for {os.path.basename(image_path)}. Skipping...\n")
+        else:
+            scored_paths.append(image_path)
+
+    labels = image_items(scored_paths, image_labels)
+    keys = {image_path: cache_key(hash_file(image_path), preprocessing_description(labels[image_path]),
+                                  engine_config)
+            for image_path in scored_paths}
+    cache = open_cache() if use_cache else None
+    ocr_results = run_cached(cache, scored_paths, keys,
+                             lambda paths: read_images([(path, labels[path]) for path in paths]))
+
+    try:
+        for image_path, (ocr_result, error) in zip(scored_paths, ocr_results):
+            image_file = os.path.basename(image_path)
+            if error is not None:
+                report(f"Error processing {image_file}: {error}\n")
+                continue
+
+            ground_truth_text = ground_truth_data[image_file]
+            ocr_text = ocr_result['text']
+            # Cached results took no OCR time in this run
+            timings = {} if ocr_result.get('cached') else dict(ocr_result.get('timings', {}))
+
+            with timed(timings, 'metrics'):
+                metrics, statistics = score_text(ocr_text, ground_truth_text)
+
+            report(format_result(image_file, ocr_text, ground_truth_text, metrics))
+            add_statistics(totals, statistics)
+            if 'tier' in ocr_result:
+                tier_counts[ocr_result['tier']] += 1
+            rows.append(make_row(run_id, engine_config, image_file, ocr_result, ground_truth_text, metrics, timings))
+            per_image_timings.append(timings)
+    finally:
+        # Stops the workers, so their peak memory can be read below, and writes the cache even when an image
+        # fails to score
+        ocr_results.close()
+        if cache is not None:
+            cache.close()
+
+    if totals['images'] > 0:
+        latency = latency_summary(per_image_timings)
+        peak_rss, peak_worker_rss = peak_rss_mb(), peak_rss_mb(children=True)
+        report(format_totals(totals) + format_tiers(tier_counts, totals['images'])
+               + format_latency_summary(latency) + format_peak_rss(peak_rss))
+    else:
+        report("No images processed.\n")
+
+    if output_format in ('text', 'both'):
+        write_text(results_file, outputs)
+    if output_format in ('jsonl', 'both'):
+        append_rows(structured_results_file, rows)
+        if totals['images'] > 0:
+            append_rows(run_summary_file, [make_run_summary(run_id, engine_config, latency, peak_rss,
+                                                            peak_worker_rss)])
+
+    return totals
+
+
+def write_text(path, outputs):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(outputs)
@@ -0,0 +1,89 @@
+import numpy as np
+
+# Every engine returns its words as [box points, text, confidence from 0 to 1] in the coordinates of the original
+# image; keras-ocr reports no confidences (None). The cache and the .jsonl results keep them as lists, and
+# word_arrays() turns them into arrays for filtering by confidence, grouping into lines or cropping regions
+# again, so none of it needs another OCR pass
+
+# Words are on the same line when their vertical centers are closer than this share of the line height
+line_overlap = 0.5
+
+
+def word_arrays(boxes):
+    # Returns the points (n, 4, 2), the texts and the confidences (n,) with NaN where the engine reports none
+    points = np.zeros((len(boxes), 4, 2), dtype=np.float32)
+    confidences = np.full(len(boxes), np.nan)
+    for index, (box, text, confidence) in enumerate(boxes):
+        points[index] = np.asarray(box, dtype=np.float32).reshape(-1, 2)[:4]
+        if confidence is not None:
+            confidences[index] = confidence
+
+    return points, [text for box, text, confidence in boxes], confidences
+
+
+def mean_confidence(boxes):
+    # Mean word confidence weighted by word length; None when the engine reports no confidences
+    if not boxes:
+        return 0.0
+    points, texts, confidences = word_arrays(boxes)
+    if np.isnan(confidences).any():
+        return None
+
+    lengths = np.array([len(text) for text in texts], dtype=float)
+
+    return float((lengths * confidences).sum() / max(lengths.sum(), 1))
+
+
+def confident_words(boxes, min_confidence):
+    # The words whose confidence reaches min_confidence; words without a confidence are kept
+    points, texts, confidences = word_arrays(boxes)
+    keep = ~(confidences < min_confidence)
+
+    return [word for word, kept in zip(boxes, keep) if kept]
+
+
+def group_lines(points):
+    # Line index of every word, lines numbered from the top; a word joins the line whose vertical center is
+    # nearest when it is within line_overlap of that line's height
+    tops, bottoms = points[:, :, 1].min(axis=1), points[:, :, 1].max(axis=1)
+    centers, heights = (tops + bottoms) / 2, np.maximum(bottoms - tops, 1)
+
+    lines = np.zeros(len(points), dtype=np.int32)
+    line_centers, line_heights, line_counts = [], [], []
+    for index in np.argsort(centers, kind='stable'):
+        distances = np.abs(np.array(line_centers) - centers[index])
+        nearest = int(distances.argmin()) if line_centers else -1
+        if nearest >= 0 and distances[nearest] <= line_overlap * max(line_heights[nearest], heights[index]):
+            lines[index] = nearest
+            line_counts[nearest] += 1
+            line_centers[nearest] += (centers[index] - line_centers[nearest]) / line_counts[nearest]
+        else:
+            lines[index] = len(line_centers)
+            line_centers.append(centers[index])
+            line_heights.append(heights[index])
+            line_counts.append(1)
+
+    return lines
+
+
+def line_boxes(boxes):
+    # Groups the words into lines, returned like the words as [box points, text, confidence], top to bottom;
+    # the words of a line are joined from left to right and its confidence is their mean weighted by length
+    if not boxes:
+        return []
+
+    points, texts, confidences = word_arrays(boxes)
+    lines = group_lines(points)
+
+    result = []
+    for line in range(lines.max() + 1):
+        words = np.flatnonzero(lines == line)
+        words = words[np.argsort(points[words, :, 0].min(axis=1), kind='stable')]
+        left, top = points[words].reshape(-1, 2).min(axis=0)
+        right, bottom = points[words].reshape(-1, 2).max(axis=0)
+        box = [[float(left), float(top)], [float(right), float(top)], [float(right), float(bottom)],
+               [float(left), float(bottom)]]
+        result.append([box, " ".join(texts[word] for word in words),
+                       mean_confidence([boxes[word] for word in words])])
+
+    return result
@@ -0,0 +1,152 @@
+import re
+import numpy as np
+from edit_distance import levenshtein, align
+
+# Code for the empty side of an insertion or deletion; it is above every Unicode code point
+gap_code = 0x110000
+
+# Changes whenever the counts of text_statistics change, so stored counts (evaluation_state.py) are not mixed
+# with new ones
+statistics_version = 2
+
+
+def extract_chars(text):
+    return re.sub(r'\s+', '', text)  # Remove all spaces but keep letters, numbers, and special characters
+
+
+def encode_chars(text):
+    # One integer code point per character
+    return np.frombuffer(extract_chars(text.lower()).encode('utf-32-le'), dtype=np.uint32)
+
+
+def aligned_codes(ocr_text, ground_truth_text):
+    # Pairs up the characters along the edit alignment, so an inserted or missing character doesn't shift
+    # every following character out of place
+    ocr_chars = encode_chars(ocr_text).tolist()
+    ground_truth_chars = encode_chars(ground_truth_text).tolist()
+
+    # With one side empty every character is an insertion or a deletion
+    if len(ocr_chars) == 0:
+        return np.full(len(ground_truth_chars), gap_code, dtype=np.uint32), np.array(ground_truth_chars, np.uint32)
+    if len(ground_truth_chars) == 0:
+        return np.array(ocr_chars, dtype=np.uint32), np.full(len(ocr_chars), gap_code, dtype=np.uint32)
+
+    pairs = align(ground_truth_chars, ocr_chars)
+    ocr_codes = np.array([gap_code if j is None else ocr_chars[j] for _, j in pairs], dtype=np.uint32)
+    ground_truth_codes = np.array([gap_code if i is None else ground_truth_chars[i] for i, _ in pairs],
+                                  dtype=np.uint32)
+
+    return ocr_codes, ground_truth_codes
+
+
+def label_scores(true_positives, true_counts, predicted_counts):
+    # Scores per label with zero_division=1, the same as sklearn's precision/recall/f1 scores
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted_counts > 0, true_positives / predicted_counts, 1.0)
+        recall = np.where(true_counts > 0, true_positives / true_counts, 1.0)
+        f1 = np.where(true_counts + predicted_counts > 0,
+                      2 * true_positives / (true_counts + predicted_counts), 1.0)
+
+    return precision, recall, f1
+
+
+def text_statistics(ocr_text, ground_truth_text):
+    # The counts of one image behind the corpus totals, and its accuracy, precision, recall and F1-score as
+    # 'metric_sums'. Summed with add_statistics and turned into corpus totals with statistics_totals, so the
+    # totals can be updated one image at a time
+    ground_truth_chars, ocr_chars = extract_chars(ground_truth_text.lower()), extract_chars(ocr_text.lower())
+    ground_truth_words, ocr_words = ground_truth_text.lower().split(), ocr_text.lower().split()
+    statistics = {
+        'images': 1,
+        'metric_sums': [0, 0, 0, 0],
+        'char_edits': levenshtein(ground_truth_chars, ocr_chars),
+        'chars': len(ground_truth_chars),
+        'word_edits': levenshtein(ground_truth_words, ocr_words),
+        'words': len(ground_truth_words),
+        'aligned': 0,
+        'correct': 0,
+        'predicted': 0,
+        'true': 0,
+        'labels': {},
+    }
+
+    ocr_codes, ground_truth_codes = aligned_codes(ocr_text, ground_truth_text)
+    if len(ground_truth_codes) == 0:
+        return statistics
+
+    correct = ocr_codes == ground_truth_codes
+    statistics.update({
+        'aligned': len(ground_truth_codes),
+        'correct': int(correct.sum()),
+        'predicted': int((ocr_codes != gap_code).sum()),
+        'true': int((ground_truth_codes != gap_code).sum()),
+    })
+
+    # True positives, true and predicted counts per character: the diagonal and the row and column sums
+    # of the confusion matrix
+    labels, codes = np.unique(np.concatenate([ground_truth_codes, ocr_codes]), return_inverse=True)
+    true_labels, predicted_labels = codes[:len(ground_truth_codes)], codes[len(ground_truth_codes):]
+    true_positives = np.bincount(true_labels[correct], minlength=len(labels))
+    true_counts = np.bincount(true_labels, minlength=len(labels))
+    predicted_counts = np.bincount(predicted_labels, minlength=len(labels))
+
+    characters = labels != gap_code
+    if statistics['predicted'] > 0 and statistics['true'] > 0:
+        precision, recall, f1 = label_scores(true_positives, true_counts, predicted_counts)
+        statistics['metric_sums'] = [statistics['correct'] / len(ground_truth_codes),
+                                     float(precision[characters].mean()), float(recall[characters].mean()),
+                                     float(f1[characters].mean())]
+
+    for label, counts in zip(labels[characters].tolist(),
+                             zip(true_positives[characters].tolist(), true_counts[characters].tolist(),
+                                 predicted_counts[characters].tolist())):
+        statistics['labels'][str(label)] = list(counts)
+
+    return statistics
+
+
+def empty_statistics():
+    return {'images': 0, 'metric_sums': [0.0, 0.0, 0.0, 0.0], 'char_edits': 0, 'chars': 0, 'word_edits': 0,
+            'words': 0, 'aligned': 0, 'correct': 0, 'predicted': 0, 'true': 0, 'labels': {}}
+
+
+def add_statistics(totals, statistics, sign=1):
+    # Adds (or with sign=-1 removes) the counts of one image to the totals in place
+    for name, value in statistics.items():
+        if name == 'metric_sums':
+            totals[name] = [total + sign * value for total, value in zip(totals[name], value)]
+        elif name == 'labels':
+            for label, counts in value.items():
+                label_totals = [total + sign * count for total, count in zip(totals[name].get(label, [0, 0, 0]),
+                                                                             counts)]
+                # A character no image contains any more is no longer part of the macro average
+                if label_totals[1] == 0 and label_totals[2] == 0:
+                    totals[name].pop(label, None)
+                else:
+                    totals[name][label] = label_totals
+        else:
+            totals[name] += sign * value
+
+    return totals
+
+
+def statistics_totals(totals):
+    # Returns the corpus CER and WER (total edits over the total ground-truth length) and the micro and macro
+    # averaged accuracy, precision, recall and F1-score
+    cer = totals['char_edits'] / totals['chars'] if totals['chars'] else 0.0
+    wer = totals['word_edits'] / totals['words'] if totals['words'] else 0.0
+
+    corpus_totals = {'micro': (0, 0, 0, 0), 'macro': (0, 0, 0, 0)}
+    if totals['aligned'] == 0:
+        return cer, wer, corpus_totals
+
+    accuracy = totals['correct'] / totals['aligned']
+    predicted, true, correct = totals['predicted'], totals['true'], totals['correct']
+    corpus_totals['micro'] = (accuracy, correct / predicted if predicted else 1.0, correct / true if true else 1.0,
+                              2 * correct / (predicted + true) if predicted + true else 1.0)
+
+    counts = np.array(list(totals['labels'].values()), dtype=np.int64).reshape(-1, 3)
+    precision, recall, f1 = label_scores(counts[:, 0], counts[:, 1], counts[:, 2])
+    corpus_totals['macro'] = (accuracy, float(precision.mean()), float(recall.mean()), float(f1.mean()))
+
+    return cer, wer, corpus_totals
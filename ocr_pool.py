@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+from multiprocessing import Pool
+from image_loader import prefetched
+# Installs the importer of the engine scripts, which spawned workers need before they unpickle the engine functions
+import ocr_engines  # noqa: F401
+
+# Environment variables read by BLAS/OpenMP, TensorFlow and tesseract when they start their thread pools
+thread_limit_variables = (
+    'OMP_NUM_THREADS',
+    'OMP_THREAD_LIMIT',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS',
+    'TF_NUM_INTEROP_THREADS',
+)
+
+# Engines built in this process, by the function that creates them; a serial run or a second pool run
+# in the same process reuses the loaded models instead of building them again
+engine_cache = {}
+
+worker_create_engine = None
+worker_function = None
+worker_item_paths = None
+worker_load_seconds = None
+
+# With prefetching, every worker gets up to prefetch_chunk items at a time and loads the next images of its
+# chunk while it reads the current one
+prefetch_chunk = 8
+
+
+def limit_threads(threads):
+    for name in thread_limit_variables:
+        os.environ[name] = str(threads)
+
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    # Libraries that were already imported have read the environment, so they are limited directly
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+
+    if 'tensorflow' in sys.modules:
+        threading = sys.modules['tensorflow'].config.threading
+        try:
+            threading.set_intra_op_parallelism_threads(threads)
+            threading.set_inter_op_parallelism_threads(threads)
+        except RuntimeError:
+            # TensorFlow refuses to change the limits once its runtime is initialized
+            pass
+
+
+def get_engine(create_engine):
+    if create_engine not in engine_cache:
+        engine_cache[create_engine] = create_engine()
+
+    return engine_cache[create_engine]
+
+
+def init_worker(create_engine, function, threads, item_paths=None):
+    global worker_create_engine, worker_function, worker_item_paths
+
+    limit_threads(threads)
+    worker_create_engine = create_engine
+    worker_function = function
+    worker_item_paths = item_paths
+
+
+def run_in_worker(item):
+    global worker_load_seconds
+
+    # The engine is built when the worker reads its first item, so a run with nothing to read loads no model
+    if worker_create_engine not in engine_cache:
+        start = time.perf_counter()
+        get_engine(worker_create_engine)
+        worker_load_seconds = time.perf_counter() - start
+
+    return worker_function(engine_cache[worker_create_engine], item)
+
+
+def run_chunk_in_worker(chunk):
+    return [run_in_worker(item) for item in prefetched(chunk, worker_item_paths)]
+
+
+def report_engine_load(timings):
+    # Adds the time this worker spent building its engine to the timings of the first image it read,
+    # as the 'engine_load' stage, so the cold start is reported apart from the per-image latency
+    global worker_load_seconds
+
+    if worker_load_seconds is not None:
+        timings['engine_load'] = worker_load_seconds
+        worker_load_seconds = None
+
+
+def run_pool(items, create_engine, function, workers=None, threads_per_worker=1, chunksize=1, item_paths=None):
+    # item_paths(item) lists the images an item reads; when it is given, the images are prefetched
+    items = list(items)
+    if not items:
+        return
+
+    # No more workers than items, every worker loads its own model
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(items))
+
+    if workers <= 1:
+        init_worker(create_engine, function, threads_per_worker, item_paths)
+        for item in items if item_paths is None else prefetched(items, item_paths):
+            yield run_in_worker(item)
+        return
+
+    initargs = (create_engine, function, threads_per_worker, item_paths)
+    # Each worker builds its engine once; imap streams the items and keeps the results in input order
+    with Pool(workers, initializer=init_worker, initargs=initargs) as pool:
+        if item_paths is None:
+            for result in pool.imap(run_in_worker, items, chunksize):
+                yield result
+            return
+
+        # Chunks small enough that every worker gets some
+        size = max(1, min(prefetch_chunk, -(-len(items) // workers)))
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        for results in pool.imap(run_chunk_in_worker, chunks):
+            for result in results:
+                yield result
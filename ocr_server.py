@@ -0,0 +1,232 @@
+import json
+import time
+import queue
+import threading
+import collections
+import cv2
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from ocr_engines import engine_scripts, load_engine_script, create_engine, recognize_batch
+from ocr_timing import timed, latency_summary, peak_rss_mb
+from preprocessing import preprocess_image
+from image_scaling import rescale_image, unscale_result
+from ocr_layout import line_boxes, confident_words
+
+host = '127.0.0.1'
+port = 8500
+engines = list(engine_scripts)
+
+# Requests that arrive within max_wait_ms of each other are recognized together, up to max_batch_size images
+max_batch_size = 8
+max_wait_ms = 10
+# Requests beyond max_queue_size per engine are refused with 503 instead of waiting without bound
+max_queue_size = 64
+request_timeout = 60
+
+# Latencies of the most recent requests kept per engine for /metrics
+latency_window = 1000
+
+
+class Batcher:
+    # One thread per engine: the engine is loaded once, then the queued images are recognized in batches
+
+    def __init__(self, engine_name):
+        self.engine_name = engine_name
+        self.requests = queue.Queue(max_queue_size)
+        self.ready = threading.Event()
+        self.load_error = None
+        self.load_seconds = None
+        self.counts = collections.Counter()
+        self.recent_timings = collections.deque(maxlen=latency_window)
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name=f"batcher-{engine_name}", daemon=True)
+
+    def submit(self, image, timings):
+        # Returns the pending request, or None when the queue is full
+        request = {'image': image, 'timings': timings, 'queued': time.perf_counter(),
+                   'done': threading.Event(), 'result': None, 'error': None}
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            with self.lock:
+                self.counts['rejected'] += 1
+            return None
+
+        return request
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + max_wait_ms / 1000
+        while len(batch) < max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def run(self):
+        try:
+            start = time.perf_counter()
+            module = load_engine_script(self.engine_name)
+            engine = create_engine(module)
+            self.load_seconds = time.perf_counter() - start
+        except Exception as e:
+            self.load_error = str(e)
+            self.ready.set()
+            return
+        self.ready.set()
+
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            for request in batch:
+                request['timings']['queue'] = started - request['queued']
+
+            try:
+                results = recognize_batch(module, engine, [request['image'] for request in batch],
+                                          [request['timings'] for request in batch])
+            except Exception as e:
+                results = [(None, str(e))] * len(batch)
+
+            with self.lock:
+                self.counts['batches'] += 1
+                self.counts['batched_images'] += len(batch)
+                for request, (result, error) in zip(batch, results):
+                    request['result'], request['error'] = result, error
+                    self.counts['errors' if error is not None else 'completed'] += 1
+                    self.recent_timings.append(request['timings'])
+
+            for request in batch:
+                request['done'].set()
+
+    def metrics(self):
+        with self.lock:
+            counts = dict(self.counts)
+            timings = list(self.recent_timings)
+
+        return {
+            'ready': self.ready.is_set() and self.load_error is None,
+            'load_error': self.load_error,
+            'load_seconds': self.load_seconds,
+            'queue_depth': self.requests.qsize(),
+            'max_queue_size': max_queue_size,
+            'completed': counts.get('completed', 0),
+            'errors': counts.get('errors', 0),
+            'rejected': counts.get('rejected', 0),
+            'batches': counts.get('batches', 0),
+            'mean_batch_size': counts['batched_images'] / counts['batches'] if counts.get('batches') else None,
+            'latency': latency_summary(timings),
+        }
+
+
+batchers = {}
+
+
+class OCRRequestHandler(BaseHTTPRequestHandler):
+    # POST /ocr?engine=easyocr&label=White%20Background with the encoded image as the body,
+    # GET /metrics for the queue depths and latencies, GET /health
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            self.send_json(200, {
+                'engines': {name: batcher.metrics() for name, batcher in batchers.items()},
+                'peak_rss_mb': peak_rss_mb(),
+            })
+        elif path == '/health':
+            ready = all(batcher.ready.is_set() for batcher in batchers.values())
+            self.send_json(200 if ready else 503, {'ready': ready})
+        else:
+            self.send_json(404, {'error': f"Unknown path: {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/ocr':
+            self.send_json(404, {'error': f"Unknown path: {url.path}"})
+            return
+
+        query = parse_qs(url.query)
+        engine_name = query.get('engine', [engines[0]])[0]
+        batcher = batchers.get(engine_name)
+        if batcher is None:
+            self.send_json(404, {'error': f"Unknown engine: {engine_name}"})
+            return
+        if not batcher.ready.is_set() or batcher.load_error is not None:
+            self.send_json(503, {'error': batcher.load_error or f"{engine_name} is still loading"},
+                           {'Retry-After': '1'})
+            return
+        try:
+            min_confidence = float(query['min_confidence'][0]) if 'min_confidence' in query else None
+        except ValueError:
+            self.send_json(400, {'error': "min_confidence must be a number from 0 to 1"})
+            return
+
+        timings = {}
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        data = self.rfile.read(length) if length > 0 else b''
+        if len(data) == 0:
+            self.send_json(400, {'error': "The body is empty; send the image file as the request body"})
+            return
+        with timed(timings, 'decode'):
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            self.send_json(400, {'error': "The body is not an image OpenCV can decode"})
+            return
+        # Without labels the image is only rescaled
+        image, scale = rescale_image(image, timings)
+        image = preprocess_image(image, query.get('label', []), timings)
+
+        request = batcher.submit(image, timings)
+        if request is None:
+            self.send_json(503, {'error': f"The {engine_name} queue is full"}, {'Retry-After': '1'})
+            return
+
+        if not request['done'].wait(request_timeout):
+            self.send_json(504, {'error': "Timed out waiting for the OCR result"})
+        elif request['error'] is not None:
+            self.send_json(500, {'error': request['error']})
+        else:
+            result, error = unscale_result((request['result'], None), scale)
+            if min_confidence is not None:
+                # Words below min_confidence are dropped from the boxes and the text
+                result['boxes'] = confident_words(result.get('boxes', []), min_confidence)
+                result['text'] = " ".join(text for box, text, confidence in result['boxes'])
+            result['lines'] = line_boxes(result.get('boxes', []))
+            self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_batchers(engine_names):
+    for engine_name in engine_names:
+        batchers[engine_name] = Batcher(engine_name)
+        batchers[engine_name].thread.start()
+
+
+if __name__ == '__main__':
+    start_batchers(engines)
+    server = ThreadingHTTPServer((host, port), OCRRequestHandler)
+    print(f"Serving {', '.join(engines)} on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
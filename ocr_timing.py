@@ -0,0 +1,108 @@
+import sys
+import time
+import contextlib
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+@contextlib.contextmanager
+def timed(timings, stage):
+    # Adds the seconds spent in the block to timings[stage]; timings is a plain dict per image
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def latency_summary(per_image_timings):
+    # Count, mean and p50/p95/p99 in milliseconds for every stage that appears in the per-image timings
+    stages = sorted({stage for timings in per_image_timings for stage in timings})
+
+    summary = {}
+    for stage in stages:
+        seconds = np.array([timings[stage] for timings in per_image_timings if stage in timings]) * 1000
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        summary[stage] = {
+            'count': int(len(seconds)),
+            'mean_ms': float(seconds.mean()),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+        }
+
+    return summary
+
+
+def format_latency_summary(summary):
+    lines = []
+    for stage, stats in summary.items():
+        lines.append(
+            f"Latency {stage}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+            f"p99 {stats['p99_ms']:.1f} ms ({stats['count']} images)\n"
+        )
+
+    return "".join(lines)
+
+
+def peak_rss_mb(children=False):
+    # Peak resident memory of this process, or of the largest finished child process (the pool workers)
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+    if children:
+        return None
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+
+    memory = psutil.Process().memory_info()
+    return getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024)
+
+
+def format_peak_rss(peak_rss):
+    # Nothing when the peak memory can't be read (Windows without psutil)
+    return f"Peak RSS: {peak_rss:.1f} MB\n" if peak_rss is not None else ""
+
+
+@contextlib.contextmanager
+def profiled(profiler, output_path):
+    # Opt-in profiling of the block: 'cprofile' writes output_path.prof, 'pyinstrument' writes output_path.html
+    if profiler is None:
+        yield
+        return
+
+    if profiler == 'cprofile':
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(output_path + '.prof')
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(20)
+    elif profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(output_path + '.html', 'w', encoding='utf-8') as f:
+                f.write(profile.output_html())
+            print(profile.output_text())
+    else:
+        raise ValueError(f"Unknown profiler: {profiler}")
@@ -0,0 +1,127 @@
+import os
+import json
+import numpy as np
+from ocr_pool import run_pool
+from ocr_engines import load_engine_script, read_single
+from ocr_metrics import text_statistics, empty_statistics, add_statistics, statistics_totals
+from ground_truth_index import load_ground_truth
+from ocr_cache import open_cache, hash_file, cache_key, run_cached
+from onnx_backend import onnx_description
+from preprocessing import image_folder, json_file_path as labels_file, load_image_labels, preprocessing_description
+
+# Reads the ground-truth images with each engine on its own backend and on ONNX Runtime, and reports what
+# the ONNX models (quantized when onnx_backend.quantize is set) cost in accuracy and save in time
+engines = ['easyocr', 'keras-ocr']
+parity_results_file = 'results/onnx_parity.json'
+
+workers = os.cpu_count()
+threads_per_worker = 1
+# Cached results keep the timings of the run that read them, so both backends are timed in this run by default
+use_cache = False
+
+# Timed stages that belong to the models; decoding and preprocessing are the same on both backends
+model_stages = ('detection', 'recognition')
+
+
+def create_engines():
+    # Engines are built on the first image each worker reads for them
+    return {}
+
+
+def read_with_backend(engines, item):
+    engine_name, onnx, image_path, labels = item
+    module = load_engine_script(engine_name)
+    if (engine_name, onnx) not in engines:
+        create = module.create_reader if hasattr(module, 'create_reader') else module.create_pipeline
+        engines[(engine_name, onnx)] = create(onnx)
+
+    return read_single(module, engines[(engine_name, onnx)], (image_path, labels))
+
+
+def backend_scores(engine_name, onnx, image_files, image_labels, ground_truth, hashes, cache):
+    module = load_engine_script(engine_name)
+    engine_config = dict(module.engine_config, onnx=onnx_description()) if onnx else module.engine_config
+    items = [(engine_name, onnx, os.path.join(image_folder, image_file), image_labels.get(image_file, []))
+             for image_file in image_files]
+    keys = [cache_key(hashes[image_file], preprocessing_description(image_labels.get(image_file, [])),
+                      engine_config) for image_file in image_files]
+
+    results = run_cached(cache, list(range(len(items))), keys,
+                         lambda pending: run_pool([items[index] for index in pending], create_engines,
+                                                  read_with_backend, workers, threads_per_worker))
+
+    texts, model_seconds, errors = [], [], 0
+    for value, error in results:
+        if value is None:
+            errors += 1
+            texts.append("")
+            continue
+        texts.append(value['text'])
+        model_seconds.append(sum(value.get('timings', {}).get(stage, 0.0) for stage in model_stages))
+
+    truths = [ground_truth[image_file] for image_file in image_files]
+    statistics = empty_statistics()
+    for text, truth in zip(texts, truths):
+        add_statistics(statistics, text_statistics(text, truth))
+    cer, wer, totals = statistics_totals(statistics)
+
+    return texts, {
+        'cer': float(cer),
+        'wer': float(wer),
+        'micro_f1': float(totals['micro'][3]),
+        'macro_f1': float(totals['macro'][3]),
+        'model_ms_per_image': float(np.mean(model_seconds) * 1000) if model_seconds else None,
+        'errors': errors,
+    }
+
+
+def compare_backends(engine_name, image_files, image_labels, ground_truth, hashes, cache):
+    native_texts, native = backend_scores(engine_name, False, image_files, image_labels, ground_truth, hashes,
+                                          cache)
+    onnx_texts, onnx = backend_scores(engine_name, True, image_files, image_labels, ground_truth, hashes, cache)
+
+    speedup = None
+    if native['model_ms_per_image'] and onnx['model_ms_per_image']:
+        speedup = native['model_ms_per_image'] / onnx['model_ms_per_image']
+
+    return {
+        'native': native,
+        'onnx': onnx,
+        'macro_f1_change': onnx['macro_f1'] - native['macro_f1'],
+        'cer_change': onnx['cer'] - native['cer'],
+        'speedup': speedup,
+        'changed_images': [image_file for image_file, native_text, onnx_text
+                           in zip(image_files, native_texts, onnx_texts) if native_text != onnx_text],
+    }
+
+
+if __name__ == '__main__':
+    image_labels = load_image_labels(labels_file)
+    module = load_engine_script(engines[0])
+    ground_truth = load_ground_truth(module.ground_truth_file)
+    image_files = [image_file for image_file in sorted(ground_truth)
+                   if os.path.exists(os.path.join(image_folder, image_file))]
+    hashes = {image_file: hash_file(os.path.join(image_folder, image_file)) for image_file in image_files}
+    cache = open_cache() if use_cache else None
+
+    report = {'onnx': onnx_description(), 'images': len(image_files), 'engines': {}}
+    for engine_name in engines:
+        comparison = compare_backends(engine_name, image_files, image_labels, ground_truth, hashes, cache)
+        report['engines'][engine_name] = comparison
+
+        native, onnx = comparison['native'], comparison['onnx']
+        print(f"{engine_name} on {len(image_files)} images")
+        for backend, scores in (('native', native), ('onnx', onnx)):
+            model_ms = scores['model_ms_per_image']
+            print(f"  {backend:<6} CER {scores['cer'] * 100:.2f}%, Macro F1 {scores['macro_f1'] * 100:.2f}%, "
+                  + (f"{model_ms:.1f} ms/image in the models" if model_ms is not None else "no images read"))
+        print(f"  Macro F1 change {comparison['macro_f1_change'] * 100:+.2f} points, "
+              + (f"{comparison['speedup']:.2f}x faster, " if comparison['speedup'] else "")
+              + f"{len(comparison['changed_images'])} images read differently")
+
+    folder = os.path.dirname(parity_results_file)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(parity_results_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Parity report saved in {parity_results_file}")
@@ -0,0 +1,181 @@
+import os
+import numpy as np
+from importlib.metadata import version
+
+# The detection and recognition models of EasyOCR and keras-ocr can run on ONNX Runtime instead of PyTorch
+# and TensorFlow. They are exported on first use into onnx_folder/<engine>/; delete the folder to export again
+# after upgrading an engine
+onnx_folder = os.path.join('models', 'onnx')
+opset = 17
+
+# INT8 dynamic quantization: the weights are stored as 8-bit integers and the activations are quantized on the fly
+quantize = True
+# Threads ONNX Runtime uses inside one operator; keep workers * intra_op_threads at or below the core count
+intra_op_threads = 1
+
+
+def onnx_description():
+    # Part of the engines' cache keys; the thread count doesn't change the output, so it is left out
+    return {'onnxruntime': version('onnxruntime'), 'opset': opset, 'quantize': quantize}
+
+
+def model_path(engine, name, quantized=False):
+    return os.path.join(onnx_folder, engine, name + ('.int8' if quantized else '') + '.onnx')
+
+
+def export_atomically(path, export):
+    # Exported next to the model and renamed over it, so a worker never opens a half-written file while
+    # another worker is exporting the same model
+    folder, name = os.path.split(path)
+    os.makedirs(folder, exist_ok=True)
+    temporary_path = os.path.join(folder, f".tmp-{os.getpid()}-{name}")
+    export(temporary_path)
+    os.replace(temporary_path, path)
+
+
+def quantize_model(path, quantized_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    export_atomically(quantized_path, lambda output_path: quantize_dynamic(path, output_path,
+                                                                           weight_type=QuantType.QInt8))
+
+
+def create_session(path):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    return onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+def load_session(engine, name, export):
+    # export(path) writes the model in ONNX format; it only runs when the model wasn't exported before
+    path = model_path(engine, name)
+    if not os.path.exists(path):
+        export_atomically(path, export)
+
+    if quantize:
+        quantized_path = model_path(engine, name, quantized=True)
+        if not os.path.exists(quantized_path):
+            quantize_model(path, quantized_path)
+        path = quantized_path
+
+    return create_session(path)
+
+
+class TorchSession:
+    # Stands in for a PyTorch module: takes and returns tensors, and runs the ONNX session in between.
+    # Inputs the exported graph doesn't have (the text argument of the recognizers) are dropped
+
+    def __init__(self, session):
+        self.session = session
+        self.input_names = [model_input.name for model_input in session.get_inputs()]
+
+    def eval(self):
+        return self
+
+    def __call__(self, *inputs):
+        import torch
+
+        feeds = {name: value.detach().cpu().numpy() for name, value in zip(self.input_names, inputs)}
+        outputs = [torch.from_numpy(output) for output in self.session.run(None, feeds)]
+
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+def export_torch(model, sample, input_name, output_names, dynamic_axes):
+    import torch
+
+    def export(path):
+        model.eval()
+        with torch.no_grad():
+            torch.onnx.export(model, sample, path, input_names=[input_name], output_names=output_names,
+                              dynamic_axes=dynamic_axes, opset_version=opset)
+
+    return export
+
+
+def use_onnx_easyocr(reader):
+    # Replaces the CRAFT detector and the CRNN recognizer of an easyocr.Reader; detect and recognize
+    # keep their pre- and post-processing and call the sessions in place of the modules
+    import torch
+
+    class Recognizer(torch.nn.Module):
+        # The recognizers take the text as a second argument for training only
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, image):
+            return self.model(image, None)
+
+    detector = load_session('easyocr', 'detector', export_torch(
+        reader.detector, torch.zeros(1, 3, 640, 640), 'image', ['regions', 'features'],
+        {'image': {0: 'batch', 2: 'height', 3: 'width'}, 'regions': {0: 'batch', 1: 'height', 2: 'width'},
+         'features': {0: 'batch', 2: 'height', 3: 'width'}}))
+    # The recognizer reads text lines resized to a height of 64 pixels
+    recognizer = load_session('easyocr', 'recognizer', export_torch(
+        Recognizer(reader.recognizer), torch.zeros(1, 1, 64, 256), 'image', ['predictions'],
+        {'image': {0: 'batch', 3: 'width'}, 'predictions': {0: 'batch', 1: 'steps'}}))
+
+    reader.detector = TorchSession(detector)
+    reader.recognizer = TorchSession(recognizer)
+
+    return reader
+
+
+class KerasSession:
+    # Stands in for a Keras model's predict
+
+    def __init__(self, session, decode=None):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.decode = decode
+
+    def predict(self, images, **kwargs):
+        output = self.session.run(None, {self.input_name: np.asarray(images, dtype=np.float32)})[0]
+
+        return output if self.decode is None else self.decode(output)
+
+
+def greedy_ctc_decode(predictions, blank):
+    # Best class at every step, repeats collapsed and blanks dropped, padded with -1 like Keras' ctc_decode
+    best = predictions.argmax(axis=2)
+    repeated = np.zeros_like(best, dtype=bool)
+    repeated[:, 1:] = best[:, 1:] == best[:, :-1]
+    keep = ~repeated & (best != blank)
+
+    decoded = np.full(best.shape, -1, dtype=np.int64)
+    for row, (classes, kept) in enumerate(zip(best, keep)):
+        labels = classes[kept]
+        decoded[row, :len(labels)] = labels
+
+    return decoded
+
+
+def export_keras(model):
+    def export(path):
+        import tensorflow as tf
+        import tf2onnx
+
+        signature = [tf.TensorSpec((None,) + tuple(model.inputs[0].shape[1:]), tf.float32, name='image')]
+        tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=path)
+
+    return export
+
+
+def use_onnx_keras_ocr(pipeline):
+    # Replaces the CRAFT detector and the CRNN recognizer of a keras_ocr Pipeline. The recognizer's prediction
+    # model ends in TensorFlow's CTC decoder, so the model before it is exported and decoded with NumPy
+    detector = load_session('keras-ocr', 'detector', export_keras(pipeline.detector.model))
+    recognizer = load_session('keras-ocr', 'recognizer', export_keras(pipeline.recognizer.model))
+
+    pipeline.detector.model = KerasSession(detector)
+    blank = pipeline.recognizer.blank_label_idx
+    pipeline.recognizer.prediction_model = KerasSession(recognizer,
+                                                        lambda predictions: greedy_ctc_decode(predictions, blank))
+
+    return pipeline
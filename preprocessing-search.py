@@ -0,0 +1,224 @@
+import os
+import json
+import itertools
+import contextlib
+import numpy as np
+import preprocessing
+from ocr_pool import run_pool
+from image_loader import single_image
+from ocr_engines import load_engine_script, create_engine, read_single
+from ocr_metrics import text_statistics, empty_statistics, add_statistics, statistics_totals
+from ground_truth_index import load_ground_truth
+from ocr_cache import open_cache, hash_file, cache_key, run_cached
+from preprocessing import image_folder, json_file_path as labels_file, load_image_labels
+
+# Every candidate pipeline of a label is run on the images with that label and scored on the ground truth;
+# the best candidate of each label is written to preprocessing_config_file, which preprocessing.py reads
+engine_name = 'tesseract'
+search_results_file = 'results/preprocessing_search.json'
+
+# Among the Pareto-optimal candidates (no other one is both more accurate and faster) the most accurate one
+# whose preprocessing and OCR take at most time_budget_ms per image is chosen; None means no limit
+time_budget_ms = None
+# Only the stages that depend on the candidate count toward its time; reading, decoding and the engine's cold
+# start are the same for every candidate
+timed_stages = ('preprocess', 'detection', 'recognition')
+
+workers = os.cpu_count()
+threads_per_worker = 1
+use_cache = True
+
+# Per label, the slots of its pipeline: each slot lists alternative steps (None skips the slot), and a parameter
+# given as a list is tried with each of its values
+search_space = {
+    'Same Back Stylewriting': [
+        [('gray', {})],
+        [('clahe', {'clip_limit': [2.0, 3.0, 5.0, 8.0], 'tile_size': [4, 8, 16]})],
+    ],
+    'Handwriting': [
+        [('median_blur', {'size': [3, 5]}), None],
+        [('clahe', {'clip_limit': [1.0, 2.0, 4.0], 'tile_size': [8]})],
+    ],
+    'White on Black': [
+        [('gray', {})],
+        [('sharpen', {}), None],
+        [('invert', {})],
+    ],
+    'Blur-High-Contrast': [
+        [('scale_abs', {'alpha': [0.5, 0.7, 1.0, 1.3], 'beta': [-90, -45, 0]})],
+        [('sharpen', {}), None],
+    ],
+    'White Background': [
+        [('gray', {})],
+        [('threshold', {'value': [120, 150, 180]})],
+    ],
+}
+
+
+def expand_step(step):
+    if step is None:
+        return [None]
+
+    name, parameters = step
+    names = list(parameters)
+    values = [value if isinstance(value, list) else [value] for value in parameters.values()]
+
+    return [(name, dict(zip(names, combination))) for combination in itertools.product(*values)]
+
+
+def candidate_pipelines(slots):
+    choices = [[step for alternative in slot for step in expand_step(alternative)] for slot in slots]
+
+    return [[step for step in combination if step is not None] for combination in itertools.product(*choices)]
+
+
+def create_search_engine():
+    module = load_engine_script(engine_name)
+
+    return module, create_engine(module)
+
+
+@contextlib.contextmanager
+def candidate_steps(label, steps):
+    # Swaps the label's steps in preprocessing for the candidate's, so the engine reads the image exactly
+    # as it would with these steps configured
+    original = preprocessing.preprocessing_pipelines
+    preprocessing.preprocessing_pipelines = [(name, steps if name == label else label_steps)
+                                             for name, label_steps in original]
+    try:
+        yield
+    finally:
+        preprocessing.preprocessing_pipelines = original
+
+
+def read_candidate(engine, item):
+    # A worker reads one item at a time, so swapping the steps doesn't affect other images
+    module, reader = engine
+    image_path, label, steps = item
+    with candidate_steps(label, steps):
+        return read_single(module, reader, (image_path, [label]))
+
+
+def pareto_front(scores):
+    # Indices of the candidates that no other candidate beats on both error rate and time
+    front = []
+    for i, (error_i, time_i) in enumerate(scores):
+        dominated = any(error_j <= error_i and time_j <= time_i and (error_j, time_j) != (error_i, time_i)
+                        for error_j, time_j in scores)
+        if not dominated:
+            front.append(i)
+
+    return front
+
+
+def choose_candidate(candidates, front):
+    within_budget = [i for i in front if time_budget_ms is None or candidates[i]['ms_per_image'] <= time_budget_ms]
+    if not within_budget:
+        return min(front, key=lambda i: candidates[i]['ms_per_image'])
+
+    return min(within_budget, key=lambda i: (candidates[i]['cer'], candidates[i]['ms_per_image']))
+
+
+def search(image_labels, ground_truth, module):
+    # Items of all labels and candidates go through one pool; results come back in the same order
+    label_images = {label: [image_file for image_file, labels in image_labels.items()
+                            if label in labels and image_file in ground_truth
+                            and os.path.exists(os.path.join(image_folder, image_file))]
+                    for label in search_space}
+    label_candidates = {label: candidate_pipelines(slots) for label, slots in search_space.items()}
+
+    items = [(os.path.join(image_folder, image_file), label, steps)
+             for label, steps_list in label_candidates.items() for steps in steps_list
+             for image_file in label_images[label]]
+    hashes = {image_path: hash_file(image_path) for image_path in {item[0] for item in items}}
+    # The same key the OCR scripts use for a single-label image with these steps, so their cached results are reused
+    keys = [cache_key(hashes[image_path], {'label': label, 'steps': steps}, module.engine_config)
+            for image_path, label, steps in items]
+
+    cache = open_cache() if use_cache else None
+    indices = list(range(len(items)))
+    results = run_cached(cache, indices, keys,
+                         lambda pending: run_pool([items[index] for index in pending], create_search_engine,
+                                                  read_candidate, workers, threads_per_worker,
+                                                  item_paths=single_image))
+
+    report = {}
+    for label, steps_list in label_candidates.items():
+        images = label_images[label]
+        if not images:
+            report[label] = {'images': [], 'candidates': [], 'chosen': None}
+            continue
+
+        candidates = []
+        for steps in steps_list:
+            texts, seconds, errors = [], [], 0
+            for image_file in images:
+                value, error = next(results)
+                if value is None:
+                    errors += 1
+                    texts.append("")
+                    continue
+                texts.append(value['text'])
+                timings = value.get('timings', {})
+                seconds.append(sum(timings.get(stage, 0.0) for stage in timed_stages))
+
+            truths = [ground_truth[image_file] for image_file in images]
+            statistics = empty_statistics()
+            for text, truth in zip(texts, truths):
+                add_statistics(statistics, text_statistics(text, truth))
+            cer, wer, totals = statistics_totals(statistics)
+            candidates.append({
+                'steps': steps,
+                'cer': float(cer),
+                'wer': float(wer),
+                'macro_f1': float(totals['macro'][3]),
+                'ms_per_image': float(np.mean(seconds) * 1000) if seconds else None,
+                'errors': errors,
+            })
+
+        scored = [i for i, candidate in enumerate(candidates) if candidate['ms_per_image'] is not None]
+        front = [scored[i] for i in pareto_front([(candidates[i]['cer'], candidates[i]['ms_per_image'])
+                                                  for i in scored])]
+        for i in front:
+            candidates[i]['pareto'] = True
+        report[label] = {
+            'images': images,
+            'candidates': candidates,
+            'chosen': choose_candidate(candidates, front) if front else None,
+        }
+
+    return report
+
+
+def save_json(path, data):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+
+if __name__ == '__main__':
+    module = load_engine_script(engine_name)
+    ground_truth = load_ground_truth(module.ground_truth_file)
+    report = search(load_image_labels(labels_file), ground_truth, module)
+    save_json(search_results_file, {'engine': module.engine_config, 'time_budget_ms': time_budget_ms,
+                                    'labels': report})
+
+    config = {}
+    for label, result in report.items():
+        if result['chosen'] is None:
+            print(f"{label}: no images to search on, keeping the default steps")
+            continue
+
+        chosen = result['candidates'][result['chosen']]
+        config[label] = chosen['steps']
+        front = [candidate for candidate in result['candidates'] if candidate.get('pareto')]
+        print(f"{label}: {len(result['candidates'])} candidates on {len(result['images'])} images, "
+              f"{len(front)} on the Pareto front")
+        print(f"  chosen {chosen['steps']}: CER {chosen['cer'] * 100:.2f}%, "
+              f"Macro F1 {chosen['macro_f1'] * 100:.2f}%, {chosen['ms_per_image']:.1f} ms/image")
+
+    save_json(preprocessing.preprocessing_config_file, config)
+    print(f"Steps saved in {preprocessing.preprocessing_config_file}, all candidates in {search_results_file}")
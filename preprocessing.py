@@ -1,130 +1,360 @@
 import os
 import cv2
 import json
+import hashlib
 import numpy as np
+from ocr_pool import run_pool
+from ocr_cache import hash_file
+from text_regions import pack_text_regions
+from image_scaling import rescale_image
+from image_loader import take_image
+from ocr_timing import timed, latency_summary, format_latency_summary, peak_rss_mb, format_peak_rss
 
 image_folder = 'vision_datasets'
 processed_folder = 'processed_images'
 json_file_path = os.path.join('image_labels', 'image_labels.json')
 
-if not os.path.exists(processed_folder):
-    os.makedirs(processed_folder)
+# The OCR scripts take the preprocessed images straight from load_scaled_image; saving them is only needed to
+# inspect them
+save_processed_images = True
+# Saves only the detected text regions of every image, packed one under the other (text_regions.py)
+crop_text_regions = False
 
+# Images are preprocessed in a pool of worker processes. The manifest records the input hash and the pipeline
+# of every saved image, so a rerun, or a run restarted after a crash, only processes new or changed images
+workers = os.cpu_count()
+manifest_file = os.path.join(processed_folder, 'manifest.jsonl')
+# Increase when an operator changes its output without changing its name or parameters
+pipeline_version = 1
 
-def preprocess_image_same_back_stylewriting(image_path):
-    image = cv2.imread(image_path)
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=5.0, tileGridSize=(8, 8))
-    enhanced_image = clahe.apply(gray_image)
 
-    return enhanced_image
+# Operators work on one decoded buffer and change it in place where OpenCV allows it.
+# Each takes the image and its parameters and returns the image for the next step
+operators = {}
 
+sharpen_kernel = np.array([[0, -1, 0],
+                           [-1, 5, -1],
+                           [0, -1, 0]])
 
-def preprocess_handwritten_image(image_path):
-    image = cv2.imread(image_path)
 
-    if image is None:
-        print(f"Failed to load image: {image_path}")
+def operator(name):
+    def register(function):
+        operators[name] = function
+        return function
+
+    return register
+
+
+@operator('gray')
+def to_gray(image):
+    if image.ndim == 2:
+        return image
+
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+@operator('clahe')
+def apply_clahe(image, clip_limit, tile_size):
+    # On color images only the lightness channel is equalized, in LAB space
+    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=(tile_size, tile_size))
+    if image.ndim == 2:
+        return clahe.apply(image)
+
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+    lab[:, :, 0] = clahe.apply(np.ascontiguousarray(lab[:, :, 0]))
+
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=image)
+
+
+@operator('median_blur')
+def median_blur(image, size):
+    return cv2.medianBlur(image, size)
+
+
+@operator('scale_abs')
+def scale_abs(image, alpha, beta):
+    # Contrast and brightness adjustment
+    return cv2.convertScaleAbs(image, image, alpha, beta)
+
+
+@operator('sharpen')
+def sharpen(image):
+    return cv2.filter2D(image, -1, sharpen_kernel, dst=image)
+
+
+@operator('invert')
+def invert(image):
+    return cv2.bitwise_not(image, image)
+
+
+@operator('threshold')
+def threshold(image, value):
+    # Simple binarization, on grayscale images
+    return cv2.threshold(image, value, 255, cv2.THRESH_BINARY, dst=image)[1]
+
+
+# The steps of every label as (operator, parameters). An image with several labels gets the steps of all of them
+# in this order, and a step that is already in the pipeline is not repeated
+preprocessing_pipelines = [
+    ('Same Back Stylewriting', [('gray', {}), ('clahe', {'clip_limit': 5.0, 'tile_size': 8})]),
+    ('Handwriting', [('median_blur', {'size': 5}), ('clahe', {'clip_limit': 2.0, 'tile_size': 8})]),
+    # Inverting highlights white text on a black background
+    ('White on Black', [('gray', {}), ('sharpen', {}), ('invert', {})]),
+    ('Blur-High-Contrast', [('scale_abs', {'alpha': 0.7, 'beta': -90}), ('sharpen', {})]),
+    ('White Background', [('gray', {}), ('threshold', {'value': 150})]),
+]
+
+# Steps chosen by preprocessing-search.py; they replace the steps above for the labels the file lists
+preprocessing_config_file = 'preprocessing_config.json'
+
+
+def load_preprocessing_config(pipelines, path=preprocessing_config_file):
+    if not os.path.exists(path):
+        return pipelines
+
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    # Steps are stored as [name, parameters] lists; tuples keep them comparable when labels are composed
+    return [(label, [(name, parameters) for name, parameters in config[label]] if label in config else steps)
+            for label, steps in pipelines]
+
+
+preprocessing_pipelines = load_preprocessing_config(preprocessing_pipelines)
+
+
+def load_image_labels(json_file_path=json_file_path):
+    with open(json_file_path, 'r') as json_file:
+        return json.load(json_file)
+
+
+def select_preprocessing(labels):
+    # Returns the matching labels joined with ' + ' and the composed steps, or (None, None) without a match
+    label_names = []
+    steps = []
+    for label, label_steps in preprocessing_pipelines:
+        if label not in labels:
+            continue
+        label_names.append(label)
+        steps.extend(step for step in label_steps if step not in steps)
+
+    if not steps:
+        return None, None
+
+    return ' + '.join(label_names), steps
+
+
+def preprocessing_description(labels):
+    if labels is None:
+        return None
+
+    label, steps = select_preprocessing(labels)
+    if steps is None:
         return None
 
-    blurred = cv2.medianBlur(image, 5)
+    return {'label': label, 'steps': steps}
+
+
+def run_steps(image, steps):
+    # The decoded buffer is reused: the caller's image may be changed in place
+    for name, parameters in steps:
+        image = operators[name](image, **parameters)
 
-    # Convert image to LAB for contrast adjustment
-    lab = cv2.cvtColor(blurred, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
+    return image
 
-    # Apply CLAHE to the L channel
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    enhanced_l = clahe.apply(l)
 
-    # Merge channels back
-    enhanced_lab = cv2.merge((enhanced_l, a, b))
+def preprocess_image(image, labels, timings=None):
+    # Applies the steps selected by the labels to a decoded image, timed as the 'preprocess' stage
+    if timings is None:
+        timings = {}
 
-    # Convert back to BGR format
-    enhanced_image = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2BGR)
+    label, steps = select_preprocessing(labels)
+    if steps is None:
+        return image
 
-    return enhanced_image
+    with timed(timings, 'preprocess'):
+        return run_steps(image, steps)
 
 
-def preprocess_white_on_black_image(image_path):
-    # Load the image in grayscale
-    img = cv2.imread(image_path, 0)
+def load_scaled_image(image_path, labels=None, timings=None):
+    # Decodes the image, rescales it to the target text height and preprocesses it with the labels' steps.
+    # Returns the image and its scale against the file
+    if timings is None:
+        timings = {}
+
+    # Prefetched by image_loader when the image was started ahead of time
+    image, decode_scale = take_image(image_path, timings)
+    if image is None:
+        return None, 1.0
+
+    image, scale = rescale_image(image, timings)
+    scale *= decode_scale
+    if labels is None:
+        return image, scale
+
+    return preprocess_image(image, labels, timings), scale
+
+
+def to_rgb(image):
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    # Enhance contrast
-    contrast_img = cv2.convertScaleAbs(img, alpha=1.0, beta=0)
 
-    # Sharpen the image
-    kernel = np.array([[0, -1, 0],
-                       [-1, 5, -1],
-                       [0, -1, 0]])
-    sharp_img = cv2.filter2D(contrast_img, -1, kernel)
+def pipeline_key(labels):
+    description = json.dumps([pipeline_version, preprocessing_description(labels), crop_text_regions],
+                             sort_keys=True)
 
-    # Invert colors to highlight white text on a black background
-    inverted_img = cv2.bitwise_not(sharp_img)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()[:16]
 
-    return inverted_img
 
+def load_manifest(path=manifest_file):
+    # The manifest is appended to after every image; the last entry of an image wins
+    manifest = {}
+    if not os.path.exists(path):
+        return manifest
 
-def preprocess_blur_high_contrast_image(image_path):
-    # Load the image
-    image = cv2.imread(image_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by a crash
+                continue
+            manifest[entry['image']] = entry
 
-    # Adjust contrast and brightness
-    alpha = 0.7
-    beta = -90
+    return manifest
 
-    # Apply brightness and contrast adjustments
-    adjusted_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
 
-    # Apply a filter to improve sharpness
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    sharpened = cv2.filter2D(adjusted_image, -1, kernel)
+def append_manifest(entry, path=manifest_file):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
 
-    return sharpened
 
+def compact_manifest(manifest, path=manifest_file):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        for entry in manifest.values():
+            f.write(json.dumps(entry) + '\n')
+    os.replace(temporary_path, path)
 
-def preprocess_white_background_image(image_path):
-    # Load the image
-    image = cv2.imread(image_path)
 
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def is_up_to_date(entry, image_path, key):
+    # The size and modification time are compared first, so unchanged inputs are not read again
+    if entry is None or entry['pipeline'] != key:
+        return False
+    if not os.path.exists(os.path.join(processed_folder, entry['image'])):
+        return False
 
-    # Apply simple thresholding (binarization)
-    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
+    stat = os.stat(image_path)
+    return stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']
 
-    return thresh
 
+def write_image_atomically(output_path, image):
+    # Written next to the output and renamed over it, so a crash never leaves a half-written image
+    folder, name = os.path.split(output_path)
+    temporary_path = os.path.join(folder, '.tmp-' + name)
+    if not cv2.imwrite(temporary_path, image):
+        raise IOError(f"Failed to write image: {output_path}")
+    os.replace(temporary_path, output_path)
 
-with open(json_file_path, 'r') as json_file:
-    image_labels = json.load(json_file)
 
-# Apply preprocessing based on the label
-for image_file, labels in image_labels.items():
+def no_engine():
+    return None
+
+
+def process_image(engine, item):
+    # Runs in a worker: returns the manifest entry, the timings, and 'unchanged' or an error message or None
+    image_file, label, labels, key, known_hash = item
     image_path = os.path.join(image_folder, image_file)
+    output_path = os.path.join(processed_folder, image_file)
+    timings = {}
+
+    if not os.path.exists(image_path):
+        return None, timings, f"Failed to load image: {image_path}"
 
-    if 'Same Back Stylewriting' in labels:
-        processed_image = preprocess_image_same_back_stylewriting(image_path)
-        output_label = 'Same Back Stylewriting'
-    elif 'Handwriting' in labels:
-        processed_image = preprocess_handwritten_image(image_path)
-        output_label = 'Handwriting'
-    elif 'White on Black' in labels:
-        processed_image = preprocess_white_on_black_image(image_path)
-        output_label = 'White on Black'
-    elif 'Blur-High-Contrast' in labels:
-        processed_image = preprocess_blur_high_contrast_image(image_path)
-        output_label = 'Blur-High-Contrast'
-    elif 'White Background' in labels:
-        processed_image = preprocess_white_background_image(image_path)
-        output_label = 'White Background'
-    else:
-        print(f"Skipping {image_file}, no relevant label found.")
-        continue
-
-    if processed_image is not None:
-        output_path = os.path.join(processed_folder, image_file)
-        cv2.imwrite(output_path, processed_image)
-        print(f"Processed and saved {output_label} labeled image: {output_path}")
-    else:
-        print(f"Processing failed for {image_file} with label {output_label}")
+    # The hash is taken before decoding, so an input that changes meanwhile is processed again next run
+    stat = os.stat(image_path)
+    with timed(timings, 'hash'):
+        input_hash = hash_file(image_path)
+    entry = {'image': image_file, 'label': label, 'pipeline': key, 'hash': input_hash,
+             'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    # Touched but not changed
+    if input_hash == known_hash and os.path.exists(output_path):
+        return entry, timings, 'unchanged'
+
+    with timed(timings, 'decode'):
+        image = cv2.imread(image_path)
+    if image is None:
+        return None, timings, f"Failed to load image: {image_path}"
+    image = preprocess_image(image, labels, timings)
+
+    if crop_text_regions:
+        image, placements = pack_text_regions(image, timings)
+
+    if save_processed_images:
+        with timed(timings, 'write'):
+            write_image_atomically(output_path, image)
+
+    return entry, timings, None
+
+
+def plan_preprocessing(image_labels, manifest):
+    # Splits the labelled images into the ones to process and the ones whose saved output is up to date
+    items = []
+    up_to_date = []
+    for image_file, labels in image_labels.items():
+        label, steps = select_preprocessing(labels)
+        if steps is None:
+            print(f"Skipping {image_file}, no relevant label found.")
+            continue
+
+        key = pipeline_key(labels)
+        entry = manifest.get(image_file)
+        image_path = os.path.join(image_folder, image_file)
+        if save_processed_images and os.path.exists(image_path) and is_up_to_date(entry, image_path, key):
+            up_to_date.append(image_file)
+            continue
+
+        known_hash = entry['hash'] if entry is not None and entry['pipeline'] == key else None
+        items.append((image_file, label, labels, key, known_hash))
+
+    return items, up_to_date
+
+
+if __name__ == '__main__':
+    if save_processed_images and not os.path.exists(processed_folder):
+        os.makedirs(processed_folder)
+
+    image_labels = load_image_labels(json_file_path)
+    manifest = load_manifest() if save_processed_images else {}
+    items, up_to_date = plan_preprocessing(image_labels, manifest)
+    print(f"{len(up_to_date)} images are up to date, {len(items)} to process")
+
+    per_image_timings = []
+    for item, (entry, timings, error) in zip(items, run_pool(items, no_engine, process_image, workers)):
+        image_file, output_label = item[0], item[1]
+        if entry is None:
+            print(f"Processing failed for {image_file} with label {output_label}: {error}")
+            continue
+
+        if save_processed_images:
+            # Recorded as soon as the image is written, so a restarted run continues from here
+            manifest[image_file] = entry
+            append_manifest(entry)
+        if error == 'unchanged':
+            print(f"Unchanged {output_label} labeled image: {image_file}")
+        elif save_processed_images:
+            print(f"Processed and saved {output_label} labeled image: {os.path.join(processed_folder, image_file)}")
+        else:
+            print(f"Processed {output_label} labeled image: {image_file}")
+        per_image_timings.append(timings)
+
+    if save_processed_images:
+        compact_manifest(manifest)
+
+    print(format_latency_summary(latency_summary(per_image_timings)), end="")
+    print(format_peak_rss(peak_rss_mb()), end="")
@@ -1,53 +1,44 @@
-import re
+import os
+import sys
 import matplotlib.pyplot as plt
 
-def parse_image_results(results_file):
-    images = []
-    accuracies = []
-    precisions = []
-    recalls = []
-    f1_scores = []
-    similarities = []
-    overall_metrics = {}
-
-    with open(results_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        if line.startswith('Image:'):
-            image_name = line.split(':')[1].strip()
-            images.append(image_name)
-        elif 'Accuracy:' in line and 'Overall' not in line:
-            accuracy = float(line.split(':')[1].strip().replace('%', '')) / 100
-            accuracies.append(accuracy)
-        elif 'Precision:' in line and 'Overall' not in line:
-            precision = float(line.split(':')[1].strip().replace('%', '')) / 100
-            precisions.append(precision)
-        elif 'Recall:' in line and 'Overall' not in line:
-            recall = float(line.split(':')[1].strip().replace('%', '')) / 100
-            recalls.append(recall)
-        elif 'F1-Score:' in line and 'Overall' not in line:
-            f1_score = float(line.split(':')[1].strip().replace('%', '')) / 100
-            f1_scores.append(f1_score)
-        elif 'Similarity:' in line:
-            similarity = float(line.split(':')[1].strip().replace('%', '')) / 100
-            similarities.append(similarity)
-        elif 'Overall Accuracy:' in line:
-            overall_metrics['Accuracy'] = float(line.split(':')[1].strip().replace('%', ''))
-        elif 'Overall Precision:' in line:
-            overall_metrics['Precision'] = float(line.split(':')[1].strip().replace('%', ''))
-        elif 'Overall Recall:' in line:
-            overall_metrics['Recall'] = float(line.split(':')[1].strip().replace('%', ''))
-        elif 'Overall F1-Score:' in line:
-            overall_metrics['F1-Score'] = float(line.split(':')[1].strip().replace('%', ''))
-
-    results = list(zip(images, accuracies, precisions, recalls, f1_scores, similarities))
-    sorted_results = sorted(results, key=lambda x: int(re.search(r'img(\d+)', x[0]).group(1)))
-
-    images, accuracies, precisions, recalls, f1_scores, similarities = zip(*sorted_results)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from results_store import load_results, latest_run, compare_runs
+
+results_folder = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_image_results(results):
+    results = latest_run(results)
+    numbers = results['image'].str.extract(r'img(\d+)', expand=False).astype(int)
+    results = results.assign(number=numbers).sort_values('number')
+
+    images = tuple(results['image'])
+    accuracies = tuple(results['accuracy'])
+    precisions = tuple(results['precision'])
+    recalls = tuple(results['recall'])
+    f1_scores = tuple(results['f1'])
+    similarities = tuple(results['similarity'])
+    overall_metrics = {
+        'Accuracy': results['accuracy'].mean() * 100,
+        'Precision': results['precision'].mean() * 100,
+        'Recall': results['recall'].mean() * 100,
+        'F1-Score': results['f1'].mean() * 100,
+    }
 
     return images, accuracies, precisions, recalls, f1_scores, similarities, overall_metrics
 
+
+def print_run_comparison(tool_name, results):
+    run_ids = results['run_id'].unique()
+    if len(run_ids) < 2:
+        return
+
+    differences = compare_runs(results, run_ids[-2], run_ids[-1])
+    print(f"{tool_name}: run {run_ids[-1]} compared to run {run_ids[-2]}")
+    print(differences.to_string(float_format=lambda value: f"{value * 100:+.2f}%"))
+    print()
+
 def plot_image_results(ocr_tools_results, metric_name, metric_index):
     fig, ax = plt.subplots(figsize=(10, 6))
 
@@ -115,15 +106,16 @@ def plot_overall_results(ocr_tools_results):
     plt.show()
 
 ocr_tools = {
-    'EasyOCR': 'easyocr_results.txt',
-    'Keras OCR': 'keras_ocr_results.txt',
-    'Tesseract': 'tesseract_results.txt'
+    'EasyOCR': 'easyocr_results.jsonl',
+    'Keras OCR': 'keras_ocr_results.jsonl',
+    'Tesseract': 'tesseract_results.jsonl'
 }
 
 ocr_tools_results = {}
 for tool_name, results_file in ocr_tools.items():
-    images, accuracies, precisions, recalls, f1_scores, similarities, overall_metrics = parse_image_results(results_file)
-    ocr_tools_results[tool_name] = (images, accuracies, precisions, recalls, f1_scores, similarities, overall_metrics)
+    results = load_results(os.path.join(results_folder, results_file))
+    print_run_comparison(tool_name, results)
+    ocr_tools_results[tool_name] = parse_image_results(results)
 
 plot_image_results(ocr_tools_results, 'Accuracy', 0)
 plot_image_results(ocr_tools_results, 'Precision', 1)
@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from ocr_layout import line_boxes
+
+# Every run appends one JSON object per image to the engine's .jsonl file, earlier runs are kept for comparison
+metric_columns = ['similarity', 'cer', 'wer', 'accuracy', 'precision', 'recall', 'f1']
+
+
+def config_hash(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def new_run_id():
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+
+def make_row(run_id, engine_config, image_file, ocr_result, ground_truth_text, metrics, timings):
+    boxes = ocr_result.get('boxes', [])
+    lines = line_boxes(boxes)
+
+    row = {
+        'run_id': run_id,
+        'engine': engine_config['engine'],
+        'config_hash': config_hash(engine_config),
+        'image': image_file,
+        'text': ocr_result['text'],
+        'ground_truth': ground_truth_text,
+        'boxes': [box for box, text, confidence in boxes],
+        'words': [text for box, text, confidence in boxes],
+        'confidences': [confidence for box, text, confidence in boxes],
+        'line_boxes': [box for box, text, confidence in lines],
+        'lines': [text for box, text, confidence in lines],
+        'line_confidences': [confidence for box, text, confidence in lines],
+        'timings': timings,
+        'cached': ocr_result.get('cached', False),
+    }
+    row.update(zip(metric_columns, metrics))
+
+    return row
+
+
+def make_run_summary(run_id, engine_config, latency, peak_rss, peak_worker_rss):
+    return {
+        'run_id': run_id,
+        'engine': engine_config['engine'],
+        'config_hash': config_hash(engine_config),
+        'latency': latency,
+        'peak_rss_mb': peak_rss,
+        'peak_worker_rss_mb': peak_worker_rss,
+    }
+
+
+def append_rows(path, rows):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, 'a', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def load_results(path, columns=None):
+    # Loads the rows into a DataFrame, one column per field
+    import pandas as pd
+
+    results = pd.read_json(path, lines=True, dtype={'run_id': str, 'config_hash': str, 'image': str})
+    if columns is not None:
+        results = results[columns]
+
+    return results
+
+
+def latest_run(results):
+    return results[results['run_id'] == results['run_id'].iloc[-1]]
+
+
+def compare_runs(results, run_a, run_b, metrics=metric_columns):
+    # Per-image metric differences of run_b against run_a
+    a = results[results['run_id'] == run_a].set_index('image')[metrics]
+    b = results[results['run_id'] == run_b].set_index('image')[metrics]
+
+    return b.sub(a).dropna(how='all')
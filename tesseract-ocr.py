@@ -1,126 +1,87 @@
 import os
-import pytesseract
-from PIL import Image
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from difflib import SequenceMatcher
-import re
+import sys
+from tesseract_api import create_tesseract, image_to_data, tesseract_version, default_backend
+from ocr_pool import run_pool, report_engine_load
+from ocr import evaluate_engine
+from ocr_timing import timed
+from text_regions import pack_text_regions, unpack_result
+from image_scaling import scaling_description, recognize_tiled, unscale_result
+from image_loader import single_image
+from preprocessing import load_scaled_image
 
 preprocessed_images_folder = 'processed_images'
 ground_truth_file = 'ground_truth'
 results_file = 'results/tesseract_results.txt'
-pytesseract.pytesseract.tesseract_cmd = r'M:\VDU 2024-2025\CARD Task\OCR-taask\OCR-task\tesseract-ocr\tesseract.exe'
+structured_results_file = 'results/tesseract_results.jsonl'
+# Only the images whose image, labels, preprocessing, engine or ground truth changed since the last run are read
+# and scored; the other results and the overall totals are kept in state_file (evaluation_state.py)
+incremental = False
+state_file = 'results/tesseract_state.sqlite'
+run_summary_file = 'results/tesseract_runs.jsonl'
 
+# 'cprofile' or 'pyinstrument' profiles the run into results/tesseract_profile.prof or .html
+profiler = None
+profile_file = 'results/tesseract_profile'
 
-def load_ground_truth(ground_truth_file):
-    ground_truth = {}
-    current_image = None
-    with open(ground_truth_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('#'):
-                current_image = line[2:].strip()
-                ground_truth[current_image] = ""
-            elif current_image:
-                ground_truth[current_image] += line + "\n"
-
-    for image in ground_truth:
-        ground_truth[image] = ground_truth[image].strip()
-
-    return ground_truth
-
-
-def extract_chars(text):
-    return re.sub(r'\s+', '', text)  # Remove all spaces but keep letters, numbers, and special characters
-
-
-def calculate_similarity(ocr_text, ground_truth_text):
-    ocr_text = extract_chars(ocr_text.lower())
-    ground_truth_text = extract_chars(ground_truth_text.lower())
-
-    return SequenceMatcher(None, ocr_text, ground_truth_text).ratio()
-
-
-def calculate_metrics(ocr_text, ground_truth_text):
-    ocr_chars = list(extract_chars(ocr_text.lower()))
-    ground_truth_chars = list(extract_chars(ground_truth_text.lower()))
-    min_len = min(len(ocr_chars), len(ground_truth_chars))
-    ocr_chars = ocr_chars[:min_len]
-    ground_truth_chars = ground_truth_chars[:min_len]
-    max_len = max(len(ocr_chars), len(ground_truth_chars))
-
-    if max_len == 0:
-        return 0, 0, 0, 0
-
-    accuracy = accuracy_score(ground_truth_chars, ocr_chars)
-    precision = precision_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    recall = recall_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-    f1 = f1_score(ground_truth_chars, ocr_chars, average='macro', zero_division=1)
-
-    return accuracy, precision, recall, f1
-
-
-def perform_ocr_evaluation(images_folder, ground_truth_data, results_file):
-    total_accuracy = 0
-    total_precision = 0
-    total_recall = 0
-    total_f1 = 0
-    total_images = 0
-
-    with open(results_file, 'w', encoding='utf-8') as f:
-        for image_file in os.listdir(images_folder):
-            if image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_path = os.path.join(images_folder, image_file)
-
-                if image_file in ground_truth_data:
-                    ground_truth_text = ground_truth_data[image_file]
-
-                    img = Image.open(image_path)
-                    ocr_text = pytesseract.image_to_string(img, lang='eng')
-                    ocr_text = ocr_text.replace('\n', ' ')
-
-                    similarity = calculate_similarity(ocr_text, ground_truth_text)
-                    accuracy, precision, recall, f1 = calculate_metrics(ocr_text, ground_truth_text)
-
-                    # Format the result
-                    result = (
-                            f"Image: {image_file}\n"
-                            f"OCR Result: {ocr_text}\n"
-                            f"Ground Truth: {ground_truth_text}\n"
-                            f"Similarity: {similarity * 100:.2f}%\n"
-                            f"Accuracy: {accuracy * 100:.2f}%\n"
-                            f"Precision: {precision * 100:.2f}%\n"
-                            f"Recall: {recall * 100:.2f}%\n"
-                            f"F1-Score: {f1 * 100:.2f}%\n"
-                            + "-" * 40 + "\n"
-                    )
-
-                    print(result)
-                    f.write(result)
-
-                    total_accuracy += accuracy
-                    total_precision += precision
-                    total_recall += recall
-                    total_f1 += f1
-                    total_images += 1
-
-        if total_images > 0:
-            overall_accuracy = total_accuracy / total_images
-            overall_precision = total_precision / total_images
-            overall_recall = total_recall / total_images
-            overall_f1 = total_f1 / total_images
-
-            overall_result = (
-                f"Overall Accuracy: {overall_accuracy * 100:.2f}%\n"
-                f"Overall Precision: {overall_precision * 100:.2f}%\n"
-                f"Overall Recall: {overall_recall * 100:.2f}%\n"
-                f"Overall F1-Score: {overall_f1 * 100:.2f}%\n"
-            )
-            print(overall_result)
-            f.write(overall_result)
-        else:
-            print("No images processed.")
-            f.write("No images processed.\n")
-
+# Read the images from vision_datasets/ and preprocess them in memory instead of reading processed_images/
+stream_preprocessing = True
 
-ground_truth_data = load_ground_truth(ground_truth_file)
-perform_ocr_evaluation(preprocessed_images_folder, ground_truth_data, results_file)
+# 'tesserocr' keeps a resident engine in every worker, 'pytesseract' starts tesseract.exe for every image
+tesseract_backend = default_backend
+
+# Every worker process runs its own tesseract engine; threads_per_worker is passed on as OMP_THREAD_LIMIT
+workers = os.cpu_count()
+threads_per_worker = 1
+
+# Only the detected text regions are recognized, packed into one smaller image; boxes are mapped back
+crop_text_regions = False
+
+# OCR results are cached by image content and engine configuration, so unchanged images are not read again
+use_cache = True
+
+
+def __getattr__(name):
+    # Asking tesseract for its version starts a process with pytesseract, so engine_config is built when it is
+    # first needed and not on every import (in every pool worker and in the server)
+    if name == 'engine_config':
+        globals()['engine_config'] = {'engine': 'tesseract', 'version': tesseract_version(tesseract_backend),
+                                      'options': {'lang': 'eng'}, 'crop_text_regions': crop_text_regions,
+                                      'scaling': scaling_description()}
+        return globals()['engine_config']
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def create_reader():
+    return create_tesseract(tesseract_backend, lang='eng')
+
+
+def recognize_image(reader, image, timings):
+    # Tesseract runs its layout analysis and recognition in one call
+    with timed(timings, 'recognition'):
+        ocr_text, words = image_to_data(reader, image, lang='eng')
+
+    return {'text': ocr_text.replace('\n', ' '), 'boxes': words, 'timings': timings}, None
+
+
+def read_image(reader, item):
+    image_path, labels = item
+    timings = {}
+    report_engine_load(timings)
+    image, scale = load_scaled_image(image_path, labels, timings)
+    if image is None:
+        return None, f"Failed to load image: {image_path}"
+
+    placements = None
+    if crop_text_regions:
+        image, placements = pack_text_regions(image, timings)
+
+    return unscale_result(unpack_result(recognize_tiled(recognize_image, reader, image, timings), placements), scale)
+
+
+def read_images(items):
+    return run_pool(items, create_reader, read_image, workers, threads_per_worker, item_paths=single_image)
+
+
+if __name__ == '__main__':
+    evaluate_engine(sys.modules[__name__])
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+tessdata_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tesseract-ocr', 'tessdata')
+
+# pytesseract runs the TESSERACT_CMD executable when it is set, otherwise the tesseract.exe bundled with the
+# project on Windows, otherwise tesseract from the PATH
+bundled_tesseract = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tesseract-ocr', 'tesseract.exe')
+
+
+def tesseract_command():
+    if os.environ.get('TESSERACT_CMD'):
+        return os.environ['TESSERACT_CMD']
+    if os.name == 'nt' and os.path.exists(bundled_tesseract):
+        return bundled_tesseract
+
+    return 'tesseract'
+
+
+pytesseract.pytesseract.tesseract_cmd = tesseract_command()
+
+# 'tesserocr' keeps one engine with eng.traineddata loaded for the whole process and reads images from memory,
+# 'pytesseract' starts tesseract.exe for every image
+default_backend = 'tesserocr' if tesserocr is not None else 'pytesseract'
+
+
+def create_tesseract(backend=default_backend, lang='eng'):
+    if backend == 'pytesseract':
+        return None
+
+    if backend != 'tesserocr':
+        raise ValueError(f"Unknown tesseract backend: {backend}")
+    if tesserocr is None:
+        raise ImportError("tesserocr is not installed, use the 'pytesseract' backend instead")
+
+    return tesserocr.PyTessBaseAPI(path=tessdata_folder, lang=lang)
+
+
+def tesseract_version(backend=default_backend):
+    if backend == 'tesserocr':
+        return tesserocr.tesseract_version()
+
+    return str(pytesseract.get_tesseract_version())
+
+
+def set_image(api, image):
+    if isinstance(image, Image.Image):
+        api.SetImage(image)
+        return
+
+    # OpenCV arrays are BGR, tesseract expects RGB
+    if image.ndim == 3:
+        image = cv2_to_rgb(image)
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    api.SetImageBytes(image.tobytes(), image.shape[1], image.shape[0], channels, image.strides[0])
+
+
+def cv2_to_rgb(image):
+    if image.shape[2] == 4:
+        return image[:, :, 2::-1]
+    return image[:, :, ::-1]
+
+
+def word_box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def image_to_data(api, image, lang='eng'):
+    # Returns the text and its words as [box points, text, confidence from 0 to 1]
+    if api is None:
+        if isinstance(image, np.ndarray) and image.ndim == 3:
+            image = cv2_to_rgb(image)
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+        words = []
+        for text, confidence, left, top, width, height in zip(data['text'], data['conf'], data['left'], data['top'],
+                                                              data['width'], data['height']):
+            # Blocks, paragraphs and lines have a confidence of -1
+            if not text.strip() or float(confidence) < 0:
+                continue
+            words.append([word_box(left, top, left + width, top + height), text, float(confidence) / 100])
+
+        return " ".join(text for box, text, confidence in words), words
+
+    set_image(api, image)
+    api.Recognize()
+
+    words = []
+    level = tesserocr.RIL.WORD
+    for word in tesserocr.iterate_level(api.GetIterator(), level):
+        text = word.GetUTF8Text(level)
+        box = word.BoundingBox(level)
+        if not text or not text.strip() or box is None:
+            continue
+        words.append([word_box(*box), text, word.Confidence(level) / 100])
+
+    return api.GetUTF8Text(), words
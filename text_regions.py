@@ -0,0 +1,138 @@
+import cv2
+import numpy as np
+from ocr_timing import timed
+
+# Text regions are found on the image scaled down to at most detection_size pixels on its longer side
+detection_size = 1024
+# Regions smaller than this (in pixels of the full image) are dropped as noise
+min_region_height = 8
+min_region_area = 200
+# Margin around every region and gap between the packed regions, in pixels
+region_padding = 6
+# When the regions cover more than this share of the image, the full image is used as it is
+max_coverage = 0.8
+
+
+def detect_text_regions(image):
+    # Text has strong local contrast: the morphological gradient marks character edges, a wide closing joins
+    # the characters of a line, and every remaining blob is one region. Returns (x, y, w, h) in reading order
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    scale = min(1.0, detection_size / max(height, width))
+    if scale < 1:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3)))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = (int(round(value / scale)) for value in cv2.boundingRect(contour))
+        if h < min_region_height or w * h < min_region_area:
+            continue
+        x0, y0 = max(0, x - region_padding), max(0, y - region_padding)
+        x1, y1 = min(width, x + w + region_padding), min(height, y + h + region_padding)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+
+    return sorted(merge_regions(regions), key=lambda region: (region[1] + region[3] // 2, region[0]))
+
+
+def merge_regions(regions):
+    # Overlapping regions are merged until none overlap, so no text is read twice
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                ax, ay, aw, ah = regions[i]
+                bx, by, bw, bh = regions[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    x0, y0 = min(ax, bx), min(ay, by)
+                    x1, y1 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                    regions[i] = (x0, y0, x1 - x0, y1 - y0)
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return regions
+
+
+def pack_regions(image, regions):
+    # Stacks the crops one under the other in reading order on the image's median color, so the engines
+    # still read the lines in order. Returns the packed image and ((x, y, w, h), packed y) per region
+    width = max(w for x, y, w, h in regions)
+    height = sum(h for x, y, w, h in regions) + region_padding * (len(regions) - 1)
+    background = np.median(image.reshape(-1, 1 if image.ndim == 2 else image.shape[2]), axis=0).astype(image.dtype)
+
+    packed = np.empty((height, width) + image.shape[2:], dtype=image.dtype)
+    packed[:] = background
+    placements = []
+    top = 0
+    for x, y, w, h in regions:
+        packed[top:top + h, :w] = image[y:y + h, x:x + w]
+        placements.append(((x, y, w, h), top))
+        top += h + region_padding
+
+    return packed, placements
+
+
+def pack_text_regions(image, timings=None):
+    # Returns the image to recognize and the placements to map its boxes back, or None when it wasn't cropped
+    if timings is None:
+        timings = {}
+
+    with timed(timings, 'text_regions'):
+        regions = detect_text_regions(image)
+        if not regions:
+            return image, None
+
+        covered = sum(w * h for x, y, w, h in regions)
+        if covered > max_coverage * image.shape[0] * image.shape[1]:
+            return image, None
+
+        packed, placements = pack_regions(image, regions)
+        # Many narrow regions of different widths can pack into more pixels than they came from
+        if packed.size >= image.size:
+            return image, None
+
+        return packed, placements
+
+
+def map_point(x, y, placements):
+    # Finds the region the point was packed into by its packed y coordinate
+    for (region_x, region_y, w, h), top in placements:
+        if y < top + h + region_padding / 2:
+            return x + region_x, y - top + region_y
+
+    (region_x, region_y, w, h), top = placements[-1]
+    return x + region_x, y - top + region_y
+
+
+def map_boxes(boxes, placements):
+    # Boxes are lists of points from the packed image; every box moves with the region its center is in
+    if placements is None:
+        return boxes
+
+    mapped = []
+    for box, text, confidence in boxes:
+        points = np.asarray(box, dtype=float).reshape(-1, 2)
+        center_x, center_y = points.mean(axis=0)
+        region_x, region_y = map_point(center_x, center_y, placements)
+        offset = (region_x - center_x, region_y - center_y)
+        mapped.append([(points + offset).tolist(), text, confidence])
+
+    return mapped
+
+
+def unpack_result(result, placements):
+    # Maps the boxes of an OCR result on the packed image back to the original image
+    value, error = result
+    if value is not None and placements is not None:
+        value['boxes'] = map_boxes(value.get('boxes', []), placements)
+
+    return value, error